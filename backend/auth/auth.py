@@ -1,7 +1,14 @@
 import os
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
-from jose import jwt, JWTError
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Optional, Callable, Dict, Any, Mapping, Tuple
+from cachetools import TTLCache
+import jwt
+from jwt import InvalidTokenError as JWTError
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 from fastapi import HTTPException, Depends
@@ -13,10 +20,35 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret_change_in_prod")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 120))
-
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+DEFAULT_EXP_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")
+JWT_ALGORITHMS = [ALGORITHM]
+
+# Un único codec JWT reutilizado (opciones resueltas una sola vez)
+_jwt = jwt.PyJWT(options={"require": ["exp"]})
+
+# Pool dedicado al hashing: argon2-cffi libera el GIL, así que los logins
+# concurrentes escalan con los núcleos sin ocupar el threadpool de FastAPI
+HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="password-hash")
+
+# argon2 (argon2-cffi, C nativo) para hashes nuevos; pbkdf2_sha256 se mantiene
+# para verificar hashes antiguos, que se re-hashean en el siguiente login correcto
+pwd_context = CryptContext(
+    schemes=["argon2", "pbkdf2_sha256"],
+    deprecated="auto",
+    argon2__rounds=3,
+    argon2__memory_cost=65536,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login/admin")
 
+# Caches en memoria para evitar round-trips a BD y decodificar el mismo JWT
+USER_CACHE_TTL = 60
+TOKEN_CACHE_TTL = 60
+_user_cache = TTLCache(maxsize=1024, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+_token_cache = TTLCache(maxsize=4096, ttl=TOKEN_CACHE_TTL)
+_token_cache_lock = threading.Lock()
+
 # ----------------------
 # Password helpers
 # ----------------------
@@ -27,75 +59,128 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verificar contraseña y devolver un hash nuevo si el actual usa un esquema obsoleto"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update_password fuera del event loop, en HASH_POOL"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(HASH_POOL, verify_and_update_password, plain_password, hashed_password)
+
+def update_user_password_hash(username: str, password_hash: str, conn=None) -> None:
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db()
+    try:
+        execute_query(
+            conn,
+            "UPDATE users SET password_hash = ? WHERE username = ?",
+            (password_hash, username),
+            commit=True
+        )
+    finally:
+        if own_conn:
+            close_db(conn)
+    invalidate_user(username)
+
 # ----------------------
 # Token helpers
 # ----------------------
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # exp es un timestamp Unix; evitar aritmética de datetime en cada login
+    expire_seconds = int(expires_delta.total_seconds()) if expires_delta else DEFAULT_EXP_SECONDS
+    to_encode["exp"] = int(time.time()) + expire_seconds
+    return _jwt.encode(to_encode, SECRET_KEY_BYTES, algorithm=ALGORITHM)
 
 def verify_token(token: str) -> Dict[str, Any]:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    with _token_cache_lock:
+        payload = _token_cache.get(token)
+    # El cache vive como máximo TOKEN_CACHE_TTL, pero nunca más allá del exp del token
+    if payload is not None and payload.get("exp", 0) > time.time():
         return payload
+
+    try:
+        payload = _jwt.decode(token, SECRET_KEY_BYTES, algorithms=JWT_ALGORITHMS)
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
 
+    with _token_cache_lock:
+        _token_cache[token] = payload
+    return payload
+
 # ----------------------
 # DB user helpers (adaptadas para PostgreSQL/SQLite)
 # ----------------------
 
-def get_user_by_username(username: str) -> Optional[dict]:
-    conn = get_db()
+def get_user_by_username(username: str, conn=None) -> Optional[Mapping[str, Any]]:
+    """Buscar usuario (cacheado, solo lectura); sin ``conn`` abre una solo si no está en cache.
+
+    Los usuarios inexistentes no se cachean: uno recién creado puede entrar de inmediato.
+    """
+    with _user_cache_lock:
+        user = _user_cache.get(username)
+    if user is not None:
+        return user
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db()
     try:
-        query = "SELECT username, password_hash, role FROM users WHERE username = ?"
+        # username es PK: LIMIT 1 y sin devolver la columna que el llamador ya conoce
+        query = "SELECT password_hash, role FROM users WHERE username = ? LIMIT 1"
         row = execute_query(conn, query, (username,), fetchone=True)
-        return dict(row) if row else None
     finally:
-        close_db(conn)
-
-def create_default_admin_from_env():
-    """
-    Crea un admin desde variables de entorno si no existe.
+        if own_conn:
+            close_db(conn)
+    if row is None:
+        return None
+
+    # Compartido entre requests: vista inmutable de una copia de la fila
+    user = MappingProxyType(dict(row))
+    with _user_cache_lock:
+        _user_cache[username] = user
+    return user
+
+def invalidate_user(username: str) -> None:
+    """Eliminar del cache el usuario tras cualquier cambio en la tabla users"""
+    with _user_cache_lock:
+        _user_cache.pop(username, None)
+
+def default_admin_from_env() -> Optional[Tuple[str, Callable[[], str]]]:
+    """(usuario, función que calcula el hash) del admin de ADMIN_USER/ADMIN_PASS, o None.
+
+    El hash argon2 es caro: init_db solo lo calcula si tiene que insertar al admin.
     """
     admin_user = os.getenv("ADMIN_USER")
     admin_pass = os.getenv("ADMIN_PASS")
     if not admin_user or not admin_pass:
-        return
-
-    conn = get_db()
-    # Verificar si el usuario ya existe
-    query_check = "SELECT username FROM users WHERE username = ?"
-    existing_user = execute_query(conn, query_check, (admin_user,), fetchone=True)
-    
-    if not existing_user:
-        hashed = get_password_hash(admin_pass)
-        query_insert = "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)"
-        execute_query(conn, query_insert, (admin_user, hashed, "admin"), commit=True)
-    close_db(conn)
+        return None
+    return admin_user, lambda: get_password_hash(admin_pass)
 
 # ----------------------
 # Dependencies (roles)
 # ----------------------
+# async def: FastAPI ejecuta las dependencias síncronas en el threadpool; estas solo
+# consultan el cache de tokens (o validan un HMAC), así que corren directo en el loop
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     payload = verify_token(token)
     return payload
 
-def admin_required(current_user: dict = Depends(get_current_user)) -> dict:
+async def admin_required(current_user: dict = Depends(get_current_user)) -> dict:
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Solo administradores")
     return current_user
 
-def voter_required(current_user: dict = Depends(get_current_user)) -> dict:
+async def voter_required(current_user: dict = Depends(get_current_user)) -> dict:
     if current_user.get("role") not in ("voter", "votante"):
         raise HTTPException(status_code=403, detail="Solo votantes")
     return current_user
 
-def admin_or_voter_required(current_user: dict = Depends(get_current_user)) -> dict:
+async def admin_or_voter_required(current_user: dict = Depends(get_current_user)) -> dict:
     if current_user.get("role") not in ("admin", "voter", "votante"):
         raise HTTPException(status_code=403, detail="Acceso no autorizado")
     return current_user
\ No newline at end of file
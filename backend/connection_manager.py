@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from typing import Dict, Set
+
+import orjson
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# ================================
+# WEBSOCKET MANAGER
+# ================================
+
+def encode_message(message: dict) -> str:
+    """Serializar un mensaje de WebSocket una sola vez para todos los destinatarios.
+
+    Se envía como frame de texto (el frontend hace JSON.parse de event.data),
+    por eso se decodifica a str en lugar de usar send_bytes.
+    """
+    return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode()
+
+class Channel:
+    """Cola de envío acotada de un WebSocket, vaciada por su propia tarea.
+
+    Encolar no espera a la red: un cliente lento solo llena su propia cola
+    y no frena a los demás.
+    """
+
+    def __init__(self, websocket: WebSocket, maxsize: int = 32):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+        self.task = asyncio.create_task(self._relay())
+
+    async def _relay(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket caído: el próximo envío lo reporta y el manager lo limpia
+            self.closed = True
+
+    def send(self, payload: str) -> bool:
+        """Encolar sin esperar; False si el socket cayó o la cola está llena"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def close(self):
+        self.closed = True
+        self.task.cancel()
+
+class ConnectionManager:
+    def __init__(self):
+        self.admin_connections: Dict[WebSocket, Channel] = {}
+        self.voter_connections: Dict[str, Channel] = {}  # code -> canal
+        self._closing: Set[asyncio.Task] = set()  # referencias a los cierres en curso
+        
+    async def connect_admin(self, websocket: WebSocket) -> Channel:
+        await websocket.accept()
+        channel = self.admin_connections[websocket] = Channel(websocket)
+        logger.info("Admin conectado. Total admins: %d", len(self.admin_connections))
+        return channel
+        
+    async def connect_voter(self, websocket: WebSocket, voter_code: str) -> Channel:
+        await websocket.accept() 
+        previous = self.voter_connections.get(voter_code)
+        if previous is not None:
+            # La pestaña anterior queda reemplazada: cerrarla para que no siga esperando mensajes
+            self._close_channel(previous, code=4000)
+        channel = self.voter_connections[voter_code] = Channel(websocket)
+        logger.info("Votante %s conectado. Total votantes: %d", voter_code, len(self.voter_connections))
+        return channel
+    
+    def disconnect_admin(self, websocket: WebSocket):
+        channel = self.admin_connections.pop(websocket, None)
+        if channel is not None:
+            channel.close()
+        logger.info("Admin desconectado. Total: %d", len(self.admin_connections))
+    
+    def disconnect_voter(self, voter_code: str, websocket: WebSocket = None):
+        """Quitar al votante; con ``websocket``, solo si sigue siendo su conexión actual"""
+        channel = self.voter_connections.get(voter_code)
+        if channel is None or (websocket is not None and channel.websocket is not websocket):
+            return
+        del self.voter_connections[voter_code]
+        channel.close()
+        logger.info("Votante %s desconectado. Total: %d", voter_code, len(self.voter_connections))
+
+    def _drop(self, channel: Channel):
+        """Cerrar el socket de un cliente caído o que no da abasto (reconecta y recarga estado)"""
+        self._close_channel(channel, code=1013)
+
+    def _close_channel(self, channel: Channel, code: int):
+        """Detener el relay y cerrar el socket en segundo plano (si no había caído ya)"""
+        alive = not channel.closed
+        channel.close()
+        if alive:
+            task = asyncio.create_task(self._close_socket(channel, code))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_socket(channel: Channel, code: int):
+        # Esperar a que el relay cancelado termine: no cerrar a mitad de un send_text
+        await asyncio.wait([channel.task])
+        try:
+            await channel.websocket.close(code=code)
+        except Exception as e:
+            logger.debug("Error cerrando WebSocket: %s", e)
+    
+    async def broadcast_to_admins(self, message: dict):
+        """Enviar mensaje a todos los administradores"""
+        self.send_payload_to_admins(encode_message(message))
+
+    def send_payload_to_admins(self, payload: str):
+        """Encolar un mensaje ya serializado (ver encode_message) para todos los administradores"""
+        failed = [ws for ws, channel in self.admin_connections.items() if not channel.send(payload)]
+
+        # Limpiar conexiones muertas o saturadas en lote (un solo log)
+        if failed:
+            for ws in failed:
+                self._drop(self.admin_connections.pop(ws))
+            logger.info("%d admins desconectados. Total: %d", len(failed), len(self.admin_connections))
+    
+    async def broadcast_to_voters(self, message: dict):
+        """Enviar mensaje a todos los votantes"""
+        self.send_payload_to_voters(encode_message(message))
+
+    def send_payload_to_voters(self, payload: str):
+        """Encolar un mensaje ya serializado (ver encode_message) para todos los votantes"""
+        failed = [code for code, channel in self.voter_connections.items() if not channel.send(payload)]
+
+        # Limpiar conexiones muertas o saturadas en lote: tras un corte de red pueden ser
+        # cientos y no vale la pena un log por votante
+        if failed:
+            for code in failed:
+                self._drop(self.voter_connections.pop(code))
+            logger.info("%d votantes desconectados. Total: %d", len(failed), len(self.voter_connections))
+    
+    async def broadcast_all(self, message: dict):
+        """Enviar el mismo mensaje a administradores y votantes, serializado una sola vez"""
+        payload = encode_message(message)
+        self.send_payload_to_admins(payload)
+        self.send_payload_to_voters(payload)
+    
+    async def send_to_voter(self, voter_code: str, message: dict):
+        """Enviar mensaje a votante específico"""
+        channel = self.voter_connections.get(voter_code)
+        if channel is not None and not channel.send(encode_message(message)):
+            self._drop(channel)
+            self.disconnect_voter(voter_code)
+
+manager = ConnectionManager()
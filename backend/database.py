@@ -1,16 +1,39 @@
 import os
+import io
+import csv
+import re
+import hashlib
+import orjson
+import random
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2.pool import ThreadedConnectionPool
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import PoolError
 import threading
 import logging
 import atexit
 import time
-from functools import wraps
+from uuid import uuid4
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from types import MappingProxyType
+from cachetools import TLRUCache
+from dotenv import load_dotenv
 
-# Configurar logging optimizado
+try:
+    import redis
+except ImportError:  # Opcional: solo necesario con REDIS_URL
+    redis = None
+
+# La configuración se lee al importar: cargar .env antes que nada
+load_dotenv()
+
+# Configurar logging optimizado (LOG_LEVEL=DEBUG solo en desarrollo)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
@@ -19,14 +42,66 @@ logger = logging.getLogger(__name__)
 postgres_pool = None
 pool_lock = threading.Lock()
 
-# Configuración optimizada para alta carga
-DB_CONFIG = {
-    'minconn': int(os.getenv("DATABASE_POOL_MIN", "5")),  # Mínimo aumentado
-    'maxconn': int(os.getenv("DATABASE_POOL_MAX", "25")), # Máximo optimizado para Railway
-    'connect_timeout': 10,
+def _parse_database_url(url):
+    """Normalizar DATABASE_URL una sola vez: devuelve (dsn para libpq, usa_pgbouncer)"""
+    if not url:
+        return None, False
+    if url.startswith("postgresql://"):
+        url = url.replace("postgresql://", "postgres://", 1)
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    pgbouncer = any(k == "pgbouncer" and v.lower() == "true" for k, v in params)
+    # libpq no reconoce el parámetro pgbouncer
+    query = [(k, v) for k, v in params if k != "pgbouncer"]
+    return urlunsplit(parts._replace(query=urlencode(query))), pgbouncer
+
+# Detrás de PgBouncer (pool_mode=transaction) se marca la URL con ?pgbouncer=true:
+# el pool local se reduce a (cores*2)+1 y se desactiva todo estado de sesión
+DATABASE_DSN, USING_PGBOUNCER = _parse_database_url(os.getenv("DATABASE_URL"))
+
+# Configuración optimizada para alta carga (solo lectura)
+DB_CONFIG = MappingProxyType({
+    'minconn': int(os.getenv("DATABASE_POOL_MIN", "2" if USING_PGBOUNCER else "5")),
+    'maxconn': int(os.getenv("DATABASE_POOL_MAX", str((os.cpu_count() or 4) * 2 + 1) if USING_PGBOUNCER else "25")),
+    'connect_timeout': 5,
+    # TCP keepalive: detectar sockets muertos (p. ej. tras un corte de red en Railway)
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+    # Validar con SELECT 1 las conexiones ociosas por más de estos segundos
+    'validate_idle_after': float(os.getenv("DATABASE_VALIDATE_IDLE_AFTER", "30")),
+    'pool_timeout': float(os.getenv("DATABASE_POOL_TIMEOUT", "5")),
     'command_timeout': 30,
     'application_name': 'asamblea_voting_system'
-}
+})
+
+# Log de queries solo en desarrollo (leído una vez, no por query)
+DEBUG_SQL = os.getenv("DEBUG_SQL") == "1"
+
+# Sentencias preparadas en el servidor (PREPARE/EXECUTE) cacheadas por conexión.
+# Incompatibles con PgBouncer en modo transacción: desactivadas automáticamente.
+PREPARE_STATEMENTS = os.getenv("DATABASE_PREPARE_STATEMENTS", "0" if USING_PGBOUNCER else "1") == "1"
+PREPARED_CACHE_SIZE = 500
+_PREPARABLE_PREFIXES = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+_PG_PARAM_RE = re.compile(r"%%|%s")
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Conexión psycopg2 con cache LRU de sentencias preparadas (query -> EXECUTE)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stmt_cache = OrderedDict()
+        self.returned_at = time.monotonic()
+
+# Errores transitorios (conexión caída, servidor reiniciando): se reintentan.
+# IntegrityError/ProgrammingError y demás fallarían igual en el reintento.
+RECOVERABLE_DB_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+RETRY_MAX_DELAY = 30
+RETRY_JITTER = 0.5
+
+def _backoff_delay(base, attempt):
+    """Backoff exponencial con jitter para no sincronizar los reintentos de todos los clientes"""
+    return min(RETRY_MAX_DELAY, base * (2 ** attempt) * (1 + random.uniform(0, RETRY_JITTER)))
 
 def retry_db_operation(max_retries=3, delay=1):
     """Decorador para reintentar operaciones de BD en caso de fallo"""
@@ -36,12 +111,13 @@ def retry_db_operation(max_retries=3, delay=1):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
-                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                except RECOVERABLE_DB_ERRORS as e:
                     if attempt == max_retries - 1:
                         logger.error(f"Failed {func.__name__} after {max_retries} attempts: {e}")
                         raise
-                    logger.warning(f"Attempt {attempt + 1} failed for {func.__name__}: {e}. Retrying in {delay}s...")
-                    time.sleep(delay * (attempt + 1))  # Backoff exponencial
+                    wait = _backoff_delay(delay, attempt)
+                    logger.warning(f"Attempt {attempt + 1} failed for {func.__name__}: {e}. Retrying in {wait:.2f}s...")
+                    time.sleep(wait)
                 except Exception as e:
                     logger.error(f"Non-recoverable error in {func.__name__}: {e}")
                     raise
@@ -49,6 +125,161 @@ def retry_db_operation(max_retries=3, delay=1):
         return wrapper
     return decorator
 
+class LockFreeConnectionPool:
+    """Pool de conexiones psycopg2 sin lock global en el camino rápido.
+
+    ``deque.append``/``deque.pop`` son atómicos en CPython, así que tomar y
+    devolver una conexión ociosa no pasa por ningún lock. Solo la apertura de
+    conexiones nuevas (camino lento, acotado por ``maxconn``) toma ``_lock``.
+    Misma interfaz que ``ThreadedConnectionPool``: getconn/putconn/closeall.
+    """
+
+    def __init__(self, minconn, maxconn, dsn, validate_idle_after=None, **kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.validate_idle_after = validate_idle_after
+        self.closed = False
+        self._dsn = dsn
+        self._kwargs = kwargs
+        self._idle = deque()
+        self._owned = set()
+        self._size = 0
+        self._lock = threading.Lock()
+        # Despierta a los hilos que esperan conexión cuando se devuelve o libera una
+        self._available = threading.Condition()
+        # Contadores de telemetría (sin lock: aproximados bajo concurrencia)
+        self.checkouts = 0
+        self.connects = 0
+        self.exhausted = 0
+        self.getconn_ns = 0
+        # Momento desde el que hay requests esperando sin que se devuelva ninguna conexión
+        self.saturated_since = None
+
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        with self._lock:
+            if self._size >= self.maxconn:
+                self.exhausted += 1
+                raise PoolError("connection pool exhausted")
+            self._size += 1
+            self.connects += 1
+        try:
+            conn = psycopg2.connect(self._dsn, connection_factory=PooledConnection, **self._kwargs)
+        except Exception:
+            with self._lock:
+                self._size -= 1
+            raise
+        self._owned.add(conn)
+        return conn
+
+    def _discard(self, conn):
+        self._owned.discard(conn)
+        with self._lock:
+            self._size -= 1
+        if not conn.closed:
+            conn.close()
+        self._notify()
+
+    def _notify(self):
+        with self._available:
+            self._available.notify()
+
+    def getconn(self, timeout=0):
+        """Tomar una conexión; si el pool está agotado, esperar hasta ``timeout`` segundos.
+
+        La espera bloquea el hilo (``threading.Condition``): nunca llamarla desde
+        el event loop.
+        """
+        if self.closed:
+            raise PoolError("connection pool is closed")
+        start = time.perf_counter_ns()
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                conn = self._idle.pop()
+            except IndexError:
+                try:
+                    conn = self._connect()
+                except PoolError:
+                    if self.saturated_since is None:
+                        self.saturated_since = time.monotonic()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise
+                    with self._available:
+                        # Re-chequear bajo el lock: putconn notifica tras devolver la conexión
+                        if not self._idle and self._size >= self.maxconn:
+                            self._available.wait(remaining)
+                    continue
+            # Chequeo local (sin round-trip): descartar conexiones que psycopg2 ya marcó
+            # como cerradas (tras un error de red o un close() explícito)
+            if conn.closed:
+                self._discard(conn)
+                continue
+            # Solo las conexiones ociosas por mucho tiempo pagan un SELECT 1 de validación
+            if self.validate_idle_after and time.monotonic() - conn.returned_at > self.validate_idle_after:
+                if not self._is_alive(conn):
+                    self._discard(conn)
+                    continue
+            break
+        self.checkouts += 1
+        self.getconn_ns += time.perf_counter_ns() - start
+        return conn
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Conexión ociosa inválida, se descarta: {e}")
+            return False
+
+    def stats(self):
+        """Contadores de uso del pool para monitoreo"""
+        checkouts = self.checkouts
+        saturated_since = self.saturated_since
+        idle = len(self._idle)
+        return {
+            "size": self._size,
+            "idle": idle,
+            "in_use": self._size - idle,
+            "saturated_seconds": round(time.monotonic() - saturated_since, 1) if saturated_since else 0.0,
+            "checkouts": checkouts,
+            "connects": self.connects,
+            "exhausted": self.exhausted,
+            "avg_getconn_us": round(self.getconn_ns / checkouts / 1000, 2) if checkouts else 0.0,
+        }
+
+    def putconn(self, conn, close=False):
+        if conn not in self._owned:
+            raise PoolError("trying to put unkeyed connection")
+        self.saturated_since = None
+        if close or conn.closed or self.closed:
+            self._discard(conn)
+        else:
+            conn.returned_at = time.monotonic()
+            self._idle.append(conn)
+            self._notify()
+
+    def in_use(self):
+        """Conexiones prestadas que aún no se han devuelto al pool"""
+        return self._size - len(self._idle)
+
+    def closeall(self):
+        self.closed = True
+        while True:
+            try:
+                conn = self._idle.pop()
+            except IndexError:
+                break
+            self._discard(conn)
+
 def init_postgres_pool():
     """Inicializar pool de conexiones PostgreSQL optimizado"""
     global postgres_pool
@@ -60,23 +291,23 @@ def init_postgres_pool():
         if postgres_pool is not None:
             return
             
-        database_url = os.getenv("DATABASE_URL")
-        if not database_url:
+        if not DATABASE_DSN:
             raise Exception("DATABASE_URL no configurada. Este sistema requiere PostgreSQL.")
-            
-        # Normalizar URL
-        if database_url.startswith("postgresql://"):
-            database_url = database_url.replace("postgresql://", "postgres://", 1)
         
         try:
             logger.info(f"Inicializando pool PostgreSQL: min={DB_CONFIG['minconn']}, max={DB_CONFIG['maxconn']}")
             
-            postgres_pool = ThreadedConnectionPool(
+            postgres_pool = LockFreeConnectionPool(
                 minconn=DB_CONFIG['minconn'],
                 maxconn=DB_CONFIG['maxconn'],
-                dsn=database_url,
+                dsn=DATABASE_DSN,
+                validate_idle_after=DB_CONFIG['validate_idle_after'],
                 cursor_factory=RealDictCursor,
                 connect_timeout=DB_CONFIG['connect_timeout'],
+                keepalives=1,
+                keepalives_idle=DB_CONFIG['keepalives_idle'],
+                keepalives_interval=DB_CONFIG['keepalives_interval'],
+                keepalives_count=DB_CONFIG['keepalives_count'],
                 application_name=DB_CONFIG['application_name']
             )
             
@@ -94,51 +325,48 @@ def init_postgres_pool():
             logger.error(f"❌ Error inicializando pool PostgreSQL: {e}")
             raise
 
-@retry_db_operation(max_retries=3, delay=0.5)
-def get_db():
-    """Obtener conexión a la base de datos PostgreSQL con reintentos"""
+def warm_pool():
+    """Preparar las sentencias calientes en todas las conexiones mínimas del pool.
+
+    Se llama tras ``init_db`` (las tablas deben existir) para que el primer
+    request de cada conexión no pague el parse/plan.
+    """
+    if not PREPARE_STATEMENTS:
+        return
     if postgres_pool is None:
         init_postgres_pool()
-    
+
+    conns = []
     try:
-        # Obtener conexión del pool con timeout
-        conn = postgres_pool.getconn()
-        if conn is None:
-            raise Exception("Pool devolvió conexión None")
-            
-        # Verificar que la conexión esté activa
-        if conn.closed:
-            logger.warning("Conexión cerrada detectada, obteniendo nueva conexión")
-            postgres_pool.putconn(conn, close=True)
-            conn = postgres_pool.getconn()
-        
-        # Configurar conexión
-        conn.autocommit = False
-        return conn
-            
+        for _ in range(DB_CONFIG['minconn']):
+            conns.append(postgres_pool.getconn())
+        for conn in conns:
+            cur = conn.cursor()
+            try:
+                for query in HOT_QUERIES:
+                    _get_prepared(conn, cur, _to_pg(query))
+                conn.commit()
+            finally:
+                cur.close()
+        logger.info(f"Pool calentado: {len(HOT_QUERIES)} sentencias preparadas en {len(conns)} conexiones")
     except Exception as e:
-        logger.error(f"Error obteniendo conexión del pool: {e}")
-        
-        # Fallback crítico: conexión directa
-        logger.warning("Usando conexión directa PostgreSQL (fallback)")
-        database_url = os.getenv("DATABASE_URL")
-        
-        if database_url.startswith("postgresql://"):
-            database_url = database_url.replace("postgresql://", "postgres://", 1)
-        
-        try:
-            conn = psycopg2.connect(
-                database_url, 
-                cursor_factory=RealDictCursor,
-                connect_timeout=DB_CONFIG['connect_timeout'],
-                application_name=DB_CONFIG['application_name'] + "_fallback"
-            )
-            conn.autocommit = False
-            logger.info("Conexión directa establecida como fallback")
-            return conn
-        except Exception as fallback_error:
-            logger.critical(f"Error en conexión directa PostgreSQL: {fallback_error}")
-            raise
+        logger.warning(f"No se pudo calentar el pool: {e}")
+    finally:
+        for conn in conns:
+            close_db(conn)
+
+@retry_db_operation(max_retries=3, delay=0.5)
+def get_db():
+    """Obtener conexión a la base de datos PostgreSQL con reintentos.
+
+    Sin fallback a conexiones directas: bajo agotamiento se espera a que se
+    libere una conexión del pool (hasta ``pool_timeout``) en vez de abrir
+    conexiones sin límite. La espera (y los reintentos) bloquean el hilo: los
+    handlers ``async def`` deben llamarla vía ``run_in_threadpool``.
+    """
+    if postgres_pool is None:
+        init_postgres_pool()
+    return postgres_pool.getconn(timeout=DB_CONFIG['pool_timeout'])
 
 def close_db(conn):
     """Cerrar conexión correctamente (devolver al pool) optimizado"""
@@ -168,36 +396,145 @@ def close_db(conn):
         except:
             pass
 
+@contextmanager
+def get_conn():
+    """Conexión del pool para un bloque ``with``; se devuelve al pool al salir"""
+    conn = get_db()
+    try:
+        yield conn
+    finally:
+        close_db(conn)
+
+def db_conn():
+    """Dependencia FastAPI: una conexión del pool por request, devuelta al finalizar"""
+    with get_conn() as conn:
+        yield conn
+
+@lru_cache(maxsize=512)
+def _to_pg(query):
+    """Convertir placeholders SQLite (?) a PostgreSQL (%s); cacheado por texto de query"""
+    return query.replace("?", "%s")
+
+def _prepare_sql(query):
+    """Convertir placeholders psycopg2 (%s) a parámetros posicionales ($1, $2...)"""
+    count = 0
+
+    def repl(match):
+        nonlocal count
+        if match.group() == "%%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    return _PG_PARAM_RE.sub(repl, query), count
+
+def _get_prepared(conn, cur, query):
+    """Devolver el ``EXECUTE`` de ``query``, preparándola la primera vez en esta conexión.
+
+    Devuelve None si la conexión no tiene cache o la sentencia no es preparable;
+    en ese caso el llamador ejecuta la query tal cual.
+    """
+    cache = getattr(conn, "stmt_cache", None)
+    if cache is None:
+        return None
+
+    if query in cache:
+        cache.move_to_end(query)
+        entry = cache[query]
+        return entry[1] if entry else None
+
+    if not query.lstrip()[:6].upper().startswith(_PREPARABLE_PREFIXES):
+        cache[query] = None
+        return None
+
+    if len(cache) >= PREPARED_CACHE_SIZE:
+        _, evicted = cache.popitem(last=False)
+        if evicted:
+            cur.execute(f"DEALLOCATE {evicted[0]}")
+
+    name = "s_" + hashlib.blake2b(query.encode(), digest_size=8).hexdigest()
+    sql, param_count = _prepare_sql(query)
+    try:
+        # Savepoint: un PREPARE fallido no debe abortar la transacción en curso
+        cur.execute(f"SAVEPOINT prepare_stmt; PREPARE {name} AS {sql}; RELEASE SAVEPOINT prepare_stmt")
+    except psycopg2.errors.DuplicatePreparedStatement:
+        cur.execute("ROLLBACK TO SAVEPOINT prepare_stmt; RELEASE SAVEPOINT prepare_stmt")
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT prepare_stmt; RELEASE SAVEPOINT prepare_stmt")
+        logger.debug("Query no preparable, se ejecuta sin PREPARE: %s", e)
+        cache[query] = None
+        return None
+
+    execute_sql = f"EXECUTE {name}" + (f"({', '.join(['%s'] * param_count)})" if param_count else "")
+    cache[query] = (name, execute_sql)
+    return execute_sql
+
+def stream_query(conn, query, params=(), itersize=1000):
+    """Iterar un resultado grande con un cursor del servidor, sin cargarlo completo en memoria"""
+    if conn is None:
+        raise Exception("Conexión a base de datos es None")
+
+    cur = conn.cursor(name=f"c_{uuid4().hex}")
+    cur.itersize = itersize
+    try:
+        cur.execute(_to_pg(query), params)
+        for row in cur:
+            yield row
+    except psycopg2.Error as e:
+        logger.error(f"Error PostgreSQL en stream_query: {e}")
+        logger.error(f"Query: {query}")
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        if not cur.closed:
+            try:
+                cur.close()
+            except psycopg2.Error:
+                pass
+
 @retry_db_operation(max_retries=2, delay=0.3)
-def execute_query(conn, query, params=(), fetchone=False, fetchall=False, commit=False):
-    """Ejecutar query PostgreSQL con manejo de errores optimizado y cache"""
+def execute_query(conn, query, params=(), fetchone=False, fetchall=False, commit=False,
+                  stream=False, itersize=1000, cursor_factory=None):
+    """Ejecutar query PostgreSQL con manejo de errores optimizado y cache.
+
+    Las filas son dicts (``RealDictCursor``) salvo que se pase otro
+    ``cursor_factory``, p. ej. ``NamedTupleCursor`` para lecturas grandes que
+    no se serializan directamente a JSON.
+    """
     if conn is None:
         raise Exception("Conexión a base de datos es None")
+
+    # Resultados grandes: devolver un iterador sobre un cursor del servidor
+    if stream:
+        return stream_query(conn, query, params, itersize=itersize)
     
     cur = None
     try:
         # Convertir placeholders SQLite a PostgreSQL si es necesario
-        postgres_query = query.replace("?", "%s")
+        postgres_query = _to_pg(query)
         
-        cur = conn.cursor()
+        cur = conn.cursor(cursor_factory=cursor_factory) if cursor_factory else conn.cursor()
         
         # Log solo en desarrollo
-        if os.getenv("DEBUG_SQL") == "1":
-            logger.debug(f"PostgreSQL Query: {postgres_query}")
-            logger.debug(f"PostgreSQL Params: {params}")
+        if DEBUG_SQL and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("PostgreSQL Query: %s", postgres_query)
+            logger.debug("PostgreSQL Params: %s", params)
         
-        # Ejecutar con timeout implícito del pool
-        cur.execute(postgres_query, params)
+        # Ejecutar como sentencia preparada si es posible (sin re-parsear ni re-planear)
+        execute_sql = None
+        if PREPARE_STATEMENTS and isinstance(params, (tuple, list)):
+            execute_sql = _get_prepared(conn, cur, postgres_query)
+        cur.execute(execute_sql or postgres_query, params)
         
         result = None
         if fetchone:
             result = cur.fetchone()
-            if result and hasattr(result, '_asdict'):
-                result = dict(result)
         elif fetchall:
             result = cur.fetchall()
-            if result and hasattr(result[0], '_asdict'):
-                result = [dict(row) for row in result]
         
         if commit:
             conn.commit()
@@ -208,6 +545,10 @@ def execute_query(conn, query, params=(), fetchone=False, fetchall=False, commit
         logger.error(f"Error PostgreSQL ejecutando query: {e}")
         logger.error(f"Query: {query}")
         logger.error(f"Params: {params}")
+
+        # El servidor ya no conoce la sentencia preparada: re-preparar en el próximo uso
+        if isinstance(e, psycopg2.errors.InvalidSqlStatementName) and hasattr(conn, "stmt_cache"):
+            conn.stmt_cache.clear()
         
         # Rollback automático en caso de error
         try:
@@ -235,13 +576,112 @@ def execute_query(conn, query, params=(), fetchone=False, fetchall=False, commit
             except:
                 pass
 
-def init_db():
-    """Inicializar base de datos PostgreSQL con índices optimizados"""
+def execute_values_query(conn, query, rows, template=None, page_size=500, commit=True):
+    """Insertar muchas filas en un round-trip por página con execute_values.
+
+    ``query`` debe usar ``VALUES %s`` (un único placeholder que se expande a
+    todas las filas). Devuelve el número de filas enviadas.
+    """
+    if conn is None:
+        raise Exception("Conexión a base de datos es None")
+    if not rows:
+        return 0
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        execute_values(cur, query, rows, template=template, page_size=page_size)
+        if commit:
+            conn.commit()
+        return len(rows)
+    except Exception as e:
+        logger.error(f"Error ejecutando inserción por lotes: {e}")
+        logger.error(f"Query: {query}")
+        try:
+            if conn and not conn.closed:
+                conn.rollback()
+        except:
+            pass
+        raise
+    finally:
+        if cur:
+            try:
+                cur.close()
+            except:
+                pass
+
+# Incrementar con cada cambio en tablas, índices u optimizaciones de init_db
+SCHEMA_VERSION = 3
+# Clave del advisory lock que serializa el DDL entre workers
+SCHEMA_LOCK_ID = 4242
+
+def _schema_version(cursor):
+    """Versión de esquema registrada en config, o None si aún no hay esquema"""
+    cursor.execute("SELECT to_regclass('config') IS NOT NULL AS present")
+    if not cursor.fetchone()["present"]:
+        return None
+    cursor.execute("SELECT value FROM config WHERE key = 'schema_version'")
+    row = cursor.fetchone()
+    return int(row["value"]) if row and row["value"] else None
+
+def _execute_ddl(cursor, statements, log_level=logging.WARNING):
+    """Ejecutar cada sentencia DDL en su propio savepoint; devuelve las que fallaron.
+
+    Un fallo (p. ej. un índice único con datos duplicados) solo descarta esa
+    sentencia: el resto del lote y la transacción de init_db siguen adelante.
+    """
+    failed = []
+    for statement in statements:
+        try:
+            cursor.execute(f"SAVEPOINT init_ddl;\n{statement};\nRELEASE SAVEPOINT init_ddl")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT init_ddl; RELEASE SAVEPOINT init_ddl")
+            logger.log(log_level, "Sentencia DDL no aplicada: %s (%s)", statement, e)
+            failed.append(statement)
+    return failed
+
+def _insert_default_admin(cursor, default_admin):
+    if default_admin:
+        username, make_hash = default_admin
+        # El hash solo se calcula si el admin todavía no existe
+        cursor.execute("SELECT 1 FROM users WHERE username = %s", (username,))
+        if cursor.fetchone() is None:
+            cursor.execute(
+                "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, 'admin') "
+                "ON CONFLICT (username) DO NOTHING",
+                (username, make_hash())
+            )
+
+def init_db(default_admin=None):
+    """Inicializar base de datos PostgreSQL con índices optimizados.
+
+    ``default_admin`` es una tupla opcional ``(username, make_hash)``: si el
+    usuario no existe se inserta, con ``make_hash()``, en la misma transacción
+    que el DDL.
+
+    Si ``config.schema_version`` ya coincide con ``SCHEMA_VERSION`` no se
+    ejecuta DDL: con varios workers solo el primero crea el esquema, bajo un
+    advisory lock, y el resto lo encuentra al día.
+    """
     logger.info("Inicializando base de datos PostgreSQL optimizada...")
     
     db = None
     try:
         db = get_db()
+        cursor = db.cursor()
+
+        version = _schema_version(cursor)
+        if version != SCHEMA_VERSION:
+            # Serializar el DDL entre workers que arrancan a la vez (se libera en el commit)
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+            version = _schema_version(cursor)
+
+        if version == SCHEMA_VERSION:
+            _insert_default_admin(cursor, default_admin)
+            db.commit()
+            cursor.close()
+            logger.info(f"✅ Esquema PostgreSQL al día (versión {SCHEMA_VERSION}), sin DDL")
+            return
         
         # Tablas con sintaxis PostgreSQL optimizada para alta concurrencia
         tables = [
@@ -312,28 +752,33 @@ def init_db():
             """
         ]
         
-        # Crear tablas
-        cursor = db.cursor()
-        for i, table_sql in enumerate(tables, 1):
-            try:
-                cursor.execute(table_sql)
-                logger.debug(f"Tabla {i}/6 creada/verificada")
-            except Exception as e:
-                logger.error(f"Error creando tabla {i}: {e}")
-                raise
+        # Crear tablas en un solo round-trip (psycopg2 admite multi-statement)
+        try:
+            cursor.execute(";\n".join(tables))
+            logger.debug("%d tablas creadas/verificadas", len(tables))
+        except Exception as e:
+            logger.error(f"Error creando tablas: {e}")
+            raise
+
+        # Administrador por defecto en la misma transacción
+        _insert_default_admin(cursor, default_admin)
         
         # Crear índices optimizados para alta concurrencia (400+ usuarios)
         indices = [
-            # Índices para participants (consultas muy frecuentes)
-            "CREATE INDEX IF NOT EXISTS idx_participants_present ON participants(present) WHERE present = 1",
-            "CREATE INDEX IF NOT EXISTS idx_participants_is_power ON participants(is_power) WHERE present = 1",
-            "CREATE INDEX IF NOT EXISTS idx_participants_coefficient ON participants(coefficient) WHERE present = 1",
-            "CREATE INDEX IF NOT EXISTS idx_participants_has_voted ON participants(has_voted) WHERE present = 1",
+            # Índices parciales de una columna sobre participants: redundantes con
+            # idx_participants_stats_cov y solo encarecían cada UPDATE de asistencia
+            "DROP INDEX IF EXISTS idx_participants_present",
+            "DROP INDEX IF EXISTS idx_participants_is_power",
+            "DROP INDEX IF EXISTS idx_participants_coefficient",
+            "DROP INDEX IF EXISTS idx_participants_has_voted",
             
-            # Índices para votes (operaciones críticas de votación)
-            "CREATE INDEX IF NOT EXISTS idx_votes_question_id ON votes(question_id)",
-            "CREATE INDEX IF NOT EXISTS idx_votes_participant_code ON votes(participant_code)",
-            "CREATE INDEX IF NOT EXISTS idx_votes_composite ON votes(question_id, participant_code)",
+            # Índices para votes: el recuento por pregunta se resuelve con un index-only
+            # scan del índice de cobertura. Los de una columna sobraban: question_id es
+            # prefijo de idx_votes_tally y participant_code de la PK
+            "DROP INDEX IF EXISTS idx_votes_question_id",
+            "DROP INDEX IF EXISTS idx_votes_participant_code",
+            "DROP INDEX IF EXISTS idx_votes_composite",
+            "CREATE INDEX IF NOT EXISTS idx_votes_tally ON votes(question_id, participant_code) INCLUDE (answer)",
             
             # Índices para questions y options
             "CREATE INDEX IF NOT EXISTS idx_questions_active ON questions(active) WHERE active = 1",
@@ -341,36 +786,51 @@ def init_db():
             "CREATE INDEX IF NOT EXISTS idx_options_question_id ON options(question_id)",
             
             # Índices para consultas de estadísticas y reportes
-            "CREATE INDEX IF NOT EXISTS idx_participants_stats ON participants(present, is_power, coefficient) WHERE present = 1",
+            # Nombre nuevo: IF NOT EXISTS no agregaría el INCLUDE al idx_participants_stats
+            # existente (sin INCLUDE), que se elimina una vez creado el de cobertura
+            "CREATE INDEX IF NOT EXISTS idx_participants_stats_cov ON participants(present, is_power, coefficient) INCLUDE (has_voted, name) WHERE present = 1",
+            "DROP INDEX IF EXISTS idx_participants_stats",
+            # Join votes -> participants del recuento: coeficiente sin leer la fila completa
+            "CREATE INDEX IF NOT EXISTS idx_participants_code_coef ON participants(code) INCLUDE (coefficient)",
             
             # Índice para config
             "CREATE INDEX IF NOT EXISTS idx_config_key ON config(key)"
         ]
         
+        # Un savepoint por sentencia: un índice que falla no descarta los demás
+        # ni aborta la creación de tablas
         logger.info("Creando índices optimizados para alta concurrencia...")
-        for idx_sql in indices:
-            try:
-                cursor.execute(idx_sql)
-                logger.debug(f"Índice creado: {idx_sql.split('idx_')[1].split(' ')[0] if 'idx_' in idx_sql else 'unknown'}")
-            except Exception as e:
-                logger.warning(f"Error creando índice (posiblemente ya existe): {e}")
+        failed_indices = _execute_ddl(cursor, indices)
+        logger.debug("%d índices creados/verificados", len(indices) - len(failed_indices))
         
         # Optimizaciones adicionales de PostgreSQL para alta carga
         optimizations = [
             # Configurar autovacuum más agresivo para tablas de alta escritura
             "ALTER TABLE votes SET (autovacuum_vacuum_scale_factor = 0.1)",
             "ALTER TABLE participants SET (autovacuum_vacuum_scale_factor = 0.2)",
-            
-            # Configurar estadísticas para el optimizador de consultas
-            "ALTER TABLE participants ALTER COLUMN present SET STATISTICS 1000",
-            "ALTER TABLE votes ALTER COLUMN question_id SET STATISTICS 1000",
+
+            # Estadísticas por defecto: present tiene 2 valores y question_id pocos,
+            # un objetivo de 1000 solo encarece cada ANALYZE (-1 restaura el default)
+            "ALTER TABLE participants ALTER COLUMN present SET STATISTICS -1",
+            "ALTER TABLE votes ALTER COLUMN question_id SET STATISTICS -1",
         ]
         
-        for opt_sql in optimizations:
-            try:
-                cursor.execute(opt_sql)
-            except Exception as e:
-                logger.debug(f"Optimización no aplicada (normal en algunas versiones): {e}")
+        # Pueden no aplicar en algunas versiones de PostgreSQL: solo a nivel debug
+        failed_optimizations = _execute_ddl(cursor, optimizations, log_level=logging.DEBUG)
+
+        # Solo marcar la versión si todo el DDL se aplicó: si no, el próximo arranque
+        # lo reintenta en lugar de saltarlo para siempre
+        if failed_indices or failed_optimizations:
+            logger.warning(
+                "Esquema incompleto (%d sentencias fallidas): schema_version sin actualizar",
+                len(failed_indices) + len(failed_optimizations)
+            )
+        else:
+            cursor.execute(
+                "INSERT INTO config (key, value) VALUES ('schema_version', %s) "
+                "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP",
+                (str(SCHEMA_VERSION),)
+            )
         
         db.commit()
         cursor.close()
@@ -387,19 +847,53 @@ def init_db():
 # FUNCIONES DE MONITOREO Y SALUD
 # ================================
 
-def get_pool_status():
-    """Obtener estado del pool de conexiones para monitoreo"""
+# Pool agotado sin que se devuelva ninguna conexión durante este tiempo: probable fuga
+POOL_LEAK_THRESHOLD_SECONDS = 60
+
+def get_pool_status(include_backends=False):
+    """Obtener estado del pool de conexiones para monitoreo.
+
+    Con ``include_backends`` agrega los backends de esta aplicación en
+    ``pg_stat_activity`` agrupados por estado (active, idle, idle in transaction...).
+    """
     if not postgres_pool:
         return {"status": "not_initialized"}
     
     try:
-        # PostgreSQL pool statistics (aproximadas)
-        return {
+        stats = postgres_pool.stats()
+        status = {
             "status": "healthy",
             "min_connections": DB_CONFIG['minconn'],
             "max_connections": DB_CONFIG['maxconn'],
-            "pool_type": "ThreadedConnectionPool"
+            "pool_type": "LockFreeConnectionPool",
+            **stats
         }
+
+        if stats["saturated_seconds"] > POOL_LEAK_THRESHOLD_SECONDS:
+            status["status"] = "saturated"
+            logger.warning(
+                f"Pool agotado hace {stats['saturated_seconds']}s sin devolver conexiones "
+                f"({stats['in_use']}/{DB_CONFIG['maxconn']} en uso): posible fuga de conexiones"
+            )
+
+        if include_backends:
+            # Con el pool agotado esta consulta también esperaría: no ocultar las métricas locales
+            conn = None
+            try:
+                conn = postgres_pool.getconn()
+                rows = execute_query(
+                    conn,
+                    "SELECT COALESCE(state, 'unknown') as state, COUNT(*) as count FROM pg_stat_activity WHERE application_name = ? GROUP BY state",
+                    (DB_CONFIG['application_name'],),
+                    fetchall=True
+                )
+                status["backends"] = {r["state"]: r["count"] for r in rows}
+            except Exception as e:
+                status["backends_error"] = str(e)
+            finally:
+                close_db(conn)
+
+        return status
     except Exception as e:
         logger.error(f"Error obteniendo estado del pool: {e}")
         return {"status": "error", "error": str(e)}
@@ -435,70 +929,148 @@ def health_check():
 # ================================
 
 class SimpleCache:
-    """Cache simple en memoria para consultas frecuentes"""
+    """Cache en memoria para consultas frecuentes (TTL por entrada + LRU acotado).
+
+    Respaldado por ``cachetools.TLRUCache`` con reloj monotónico: una sola tabla
+    hash, expiración inmune a saltos del reloj del sistema y tamaño máximo fijo.
+    Cada entrada guarda su propio TTL (``ttl`` de ``set`` o ``default_ttl``).
+    """
     
-    def __init__(self, default_ttl=30):
-        self.cache = {}
-        self.timestamps = {}
+    def __init__(self, default_ttl=30, maxsize=1024):
         self.default_ttl = default_ttl
+        self.cache = TLRUCache(maxsize=maxsize, ttu=self._ttu, timer=time.monotonic)
+        # TLRUCache reordena su LRU incluso en lecturas: todas las operaciones van bajo lock
         self._lock = threading.Lock()
+
+    @staticmethod
+    def _ttu(key, entry, now):
+        return now + entry[0]
     
     def get(self, key):
         with self._lock:
-            if key in self.cache:
-                if time.time() - self.timestamps[key] < self.default_ttl:
-                    return self.cache[key]
-                else:
-                    # Expirado
-                    del self.cache[key]
-                    del self.timestamps[key]
-            return None
+            entry = self.cache.get(key)
+        return entry[1] if entry is not None else None
     
     def set(self, key, value, ttl=None):
         with self._lock:
-            self.cache[key] = value
-            self.timestamps[key] = time.time()
+            self.cache[key] = (ttl or self.default_ttl, value)
     
     def delete(self, key):
         with self._lock:
-            if key in self.cache:
-                del self.cache[key]
-                del self.timestamps[key]
+            self.cache.pop(key, None)
     
     def clear(self):
         with self._lock:
             self.cache.clear()
-            self.timestamps.clear()
     
     def get_stats(self):
         with self._lock:
             return {
+                "backend": "memory",
                 "entries": len(self.cache),
-                "memory_usage": f"{len(str(self.cache))} chars"
+                "max_entries": self.cache.maxsize,
+                "ttl_seconds": self.default_ttl
             }
 
+class RedisCache:
+    """Cache compartido entre workers en Redis (misma interfaz que SimpleCache).
+
+    Un fallo de Redis nunca tumba un request: se registra y se trata como
+    cache miss, así la consulta va directo a PostgreSQL.
+    """
+
+    def __init__(self, url, default_ttl=30, prefix="asamblea:cache:", max_connections=32):
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self.client = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(
+            url, max_connections=max_connections, timeout=1, socket_timeout=1
+        ))
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except redis.RedisError as e:
+            logger.warning(f"Redis no disponible (get): {e}")
+            return None
+        if value is None:
+            return None
+        # JSON y no pickle: quien pueda escribir en este Redis no puede ejecutar código aquí
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return None
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.client.setex(self.prefix + key, ttl or self.default_ttl, orjson.dumps(value))
+        except orjson.JSONEncodeError as e:
+            logger.warning(f"Valor no serializable para Redis ({key}): {e}")
+        except redis.RedisError as e:
+            logger.warning(f"Redis no disponible (set): {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except redis.RedisError as e:
+            logger.warning(f"Redis no disponible (delete): {e}")
+
+    def clear(self):
+        try:
+            keys = list(self.client.scan_iter(match=self.prefix + "*", count=500))
+            if keys:
+                self.client.delete(*keys)
+        except redis.RedisError as e:
+            logger.warning(f"Redis no disponible (clear): {e}")
+
+    def get_stats(self):
+        return {
+            "backend": "redis",
+            "ttl_seconds": self.default_ttl
+        }
+
+def _create_query_cache(default_ttl):
+    """Redis si REDIS_URL está configurada (compartido entre workers); si no, cache en memoria"""
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        if redis is None:
+            logger.warning("REDIS_URL configurada pero el paquete redis no está instalado; usando cache en memoria")
+        else:
+            logger.info("Cache de consultas en Redis")
+            return RedisCache(redis_url, default_ttl=default_ttl)
+    return SimpleCache(default_ttl=default_ttl)
+
 # Instancia global de cache
-query_cache = SimpleCache(default_ttl=15)  # 15 segundos para datos dinámicos
+query_cache = _create_query_cache(default_ttl=15)  # 15 segundos para datos dinámicos
+
+# Incrementar si cambia el formato de los resultados cacheados
+CACHE_KEY_VERSION = 2
+
+def make_cache_key(key, args=(), kwargs=None):
+    """Clave determinista (igual en todos los procesos) para cached_query"""
+    payload = orjson.dumps((CACHE_KEY_VERSION, args, sorted((kwargs or {}).items())))
+    return f"{key}:{hashlib.blake2b(payload, digest_size=16).hexdigest()}"
 
 def cached_query(key, ttl=None):
     """Decorador para cachear resultados de queries"""
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            cache_key = f"{key}:{hash(str(args) + str(kwargs))}"
+            cache_key = make_cache_key(key, args, kwargs)
             
             # Intentar obtener del cache
             cached_result = query_cache.get(cache_key)
             if cached_result is not None:
-                logger.debug(f"Cache hit for {cache_key}")
+                logger.debug("Cache hit for %s", cache_key)
                 return cached_result
             
             # Ejecutar función y cachear resultado
             result = func(*args, **kwargs)
             query_cache.set(cache_key, result, ttl)
-            logger.debug(f"Cache set for {cache_key}")
+            logger.debug("Cache set for %s", cache_key)
             
             return result
+
+        wrapper.cache_key = lambda *args, **kwargs: make_cache_key(key, args, kwargs)
         return wrapper
     return decorator
 
@@ -511,6 +1083,9 @@ def cleanup_connections():
     global postgres_pool
     if postgres_pool:
         try:
+            leaked = postgres_pool.in_use()
+            if leaked:
+                logger.warning(f"{leaked} conexiones no fueron devueltas al pool antes del cierre")
             postgres_pool.closeall()
             logger.info("Pool de conexiones cerrado correctamente")
         except Exception as e:
@@ -518,6 +1093,9 @@ def cleanup_connections():
 
 def cleanup_cache():
     """Limpiar cache al finalizar aplicación"""
+    # El cache en Redis es compartido: no vaciarlo cuando termina un solo worker
+    if not isinstance(query_cache, SimpleCache):
+        return
     try:
         query_cache.clear()
         logger.info("Cache limpiado correctamente")
@@ -528,65 +1106,196 @@ def cleanup_cache():
 # FUNCIONES DE UTILIDAD ESPECÍFICAS
 # ================================
 
+# Agregados de aforo en un solo scan de participants
+AFORO_STATS_SQL = """
+    SELECT 
+        COUNT(*) as total_participants,
+        COUNT(CASE WHEN present = 1 THEN 1 END) as present_count,
+        COUNT(CASE WHEN present = 1 AND is_power = false THEN 1 END) as own_votes,
+        COUNT(CASE WHEN present = 1 AND is_power = true THEN 1 END) as power_votes,
+        COUNT(CASE WHEN present = 1 AND has_voted = 1 THEN 1 END) as voted_count,
+        COALESCE(SUM(CASE WHEN present = 1 THEN coefficient ELSE 0 END), 0) as present_coefficient,
+        COALESCE(SUM(coefficient), 0) as total_coefficient
+    FROM participants
+"""
+
+DASHBOARD_SNAPSHOT_SQL = f"WITH a AS ({AFORO_STATS_SQL}) SELECT a.*, CURRENT_TIMESTAMP as server_time FROM a"
+
+# Voto + marca has_voted en un solo round-trip. El UPDATE no ve la fila recién
+# insertada (mismo snapshot), por eso excluye la pregunta votada del chequeo de
+# "votó en todas las preguntas activas".
+RECORD_VOTE_SQL = """
+    WITH v AS (
+        INSERT INTO votes (participant_code, question_id, answer, timestamp)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (participant_code, question_id) DO NOTHING
+        RETURNING participant_code, question_id
+    ), u AS (
+        UPDATE participants p SET has_voted = 1
+        FROM v
+        WHERE p.code = v.participant_code
+          AND p.has_voted = 0
+          AND NOT EXISTS (
+              SELECT 1 FROM questions q
+              WHERE q.active = 1 AND q.id <> v.question_id
+                AND NOT EXISTS (
+                    SELECT 1 FROM votes x
+                    WHERE x.participant_code = v.participant_code AND x.question_id = q.id
+                )
+          )
+        RETURNING p.code
+    )
+    SELECT (SELECT COUNT(*) FROM v) AS inserted, (SELECT COUNT(*) FROM u) AS flagged
+"""
+
+# Sentencias del camino caliente que se preparan al iniciar el pool. Los routers
+# importan estas constantes: el cache de sentencias preparadas es por texto exacto.
+PARTICIPANT_BY_CODE_SQL = "SELECT code, name, is_power, present, coefficient FROM participants WHERE code = ?"
+OPEN_QUESTION_SQL = "SELECT * FROM questions WHERE id = ? AND active = 1 AND closed = 0"
+VALID_OPTIONS_SQL = "SELECT option_text FROM options WHERE question_id = ? AND option_text = ANY(?)"
+
+HOT_QUERIES = (
+    DASHBOARD_SNAPSHOT_SQL,
+    PARTICIPANT_BY_CODE_SQL,
+    OPEN_QUESTION_SQL,
+    VALID_OPTIONS_SQL,
+    RECORD_VOTE_SQL,
+)
+
+def get_dashboard_snapshot():
+    """Aforo + verificación de salud de la BD en un solo round-trip (sin cache)"""
+    conn = get_db()
+    try:
+        snapshot = execute_query(
+            conn,
+            DASHBOARD_SNAPSHOT_SQL,
+            fetchone=True
+        )
+        return dict(snapshot)
+    finally:
+        close_db(conn)
+
+def record_vote(conn, participant_code, question_id, answer, timestamp):
+    """Registrar un voto y actualizar has_voted en una sola sentencia.
+
+    Devuelve False si el participante ya había votado en la pregunta. Si el
+    voto completó todas las preguntas activas, invalida el aforo cacheado.
+    """
+    result = execute_query(
+        conn,
+        RECORD_VOTE_SQL,
+        (participant_code, question_id, answer, timestamp),
+        fetchone=True,
+        commit=True
+    )
+    if result["flagged"]:
+        invalidate_aforo_stats()
+    if result["inserted"]:
+        invalidate_voter_cache(participant_code)
+    return bool(result["inserted"])
+
 @cached_query("aforo_stats", ttl=5)
 def get_cached_aforo_stats():
-    """Obtener estadísticas de aforo cacheadas (muy solicitadas)"""
+    """Obtener estadísticas de aforo cacheadas (muy solicitadas).
+
+    El cache se invalida explícitamente en cada escritura que cambia el aforo
+    (ver ``invalidate_aforo_stats``), así que entre escrituras las lecturas no
+    vuelven a recorrer participants.
+    """
+    return get_dashboard_snapshot()
+
+def invalidate_aforo_stats():
+    """Descartar las estadísticas de aforo cacheadas tras modificar participants"""
+    query_cache.delete(get_cached_aforo_stats.cache_key())
+
+@cached_query("voter_info", ttl=15)
+def get_cached_voter_info(code):
+    """Datos de un participante para el panel de administración (None si no existe)"""
     conn = get_db()
     try:
-        stats = execute_query(
+        participant = execute_query(
             conn,
-            """
-            SELECT 
-                COUNT(*) as total_participants,
-                COUNT(CASE WHEN present = 1 THEN 1 END) as present_count,
-                COUNT(CASE WHEN present = 1 AND is_power = false THEN 1 END) as own_votes,
-                COUNT(CASE WHEN present = 1 AND is_power = true THEN 1 END) as power_votes,
-                COALESCE(SUM(CASE WHEN present = 1 THEN coefficient ELSE 0 END), 0) as present_coefficient,
-                COALESCE(SUM(coefficient), 0) as total_coefficient
-            FROM participants
-            """,
+            "SELECT code, name, coefficient, present, is_power, has_voted FROM participants WHERE code = ?",
+            (code,),
             fetchone=True
         )
-        return stats
+        return dict(participant) if participant else None
+    finally:
+        close_db(conn)
+
+@cached_query("voter_votes", ttl=15)
+def get_cached_voter_votes(code):
+    """Votos de un participante para el panel de administración"""
+    conn = get_db()
+    try:
+        votes = execute_query(
+            conn,
+            """SELECT v.question_id, v.answer, q.text as question_text, v.timestamp
+               FROM votes v
+               JOIN questions q ON v.question_id = q.id
+               WHERE v.participant_code = ?
+               ORDER BY v.timestamp""",
+            (code,),
+            fetchall=True
+        )
+        return [dict(vote) for vote in votes]
     finally:
         close_db(conn)
 
+def invalidate_voter_cache(code):
+    """Descartar los datos cacheados de un participante tras modificar sus votos o asistencia"""
+    query_cache.delete(get_cached_voter_info.cache_key(code))
+    query_cache.delete(get_cached_voter_votes.cache_key(code))
+
 def batch_insert_participants(participants_data):
-    """Inserción optimizada por lotes para cargas masivas"""
+    """Inserción optimizada por lotes para cargas masivas.
+
+    Los datos se cargan con COPY FROM STDIN en una tabla temporal (ON COMMIT
+    DROP, privada de la sesión) y se pasan a ``participants`` con un único
+    INSERT ... SELECT ... ON CONFLICT en la misma transacción.
+    """
     if not participants_data:
         return 0
-    
+
+    # Un código repetido no puede actualizarse dos veces en el mismo ON CONFLICT
+    rows = {}
+    for data in participants_data:
+        rows[data['code']] = (data['code'], data['name'], data['coefficient'], data.get('has_voted', 0), 0)
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows.values())
+    buffer.seek(0)
+
     conn = get_db()
     try:
         cursor = conn.cursor()
-        
-        # Usar COPY para inserción masiva más eficiente
-        insert_query = """
+        cursor.execute("""
+            CREATE TEMP TABLE participants_staging
+                (code TEXT, name TEXT, coefficient REAL, has_voted INTEGER, present INTEGER)
+            ON COMMIT DROP
+        """)
+        cursor.copy_expert(
+            "COPY participants_staging (code, name, coefficient, has_voted, present) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        cursor.execute("""
             INSERT INTO participants (code, name, coefficient, has_voted, present)
-            VALUES %s
+            SELECT code, name, coefficient, has_voted, present FROM participants_staging
             ON CONFLICT (code) DO UPDATE SET
                 name = EXCLUDED.name,
                 coefficient = EXCLUDED.coefficient,
                 has_voted = EXCLUDED.has_voted,
                 present = EXCLUDED.present,
                 updated_at = CURRENT_TIMESTAMP
-        """
-        
-        # Preparar datos para psycopg2.extras.execute_values
-        values = [
-            (data['code'], data['name'], data['coefficient'], data.get('has_voted', 0), 0)
-            for data in participants_data
-        ]
-        
-        from psycopg2.extras import execute_values
-        execute_values(cursor, insert_query, values)
+        """)
         
         rows_affected = cursor.rowcount
         conn.commit()
         cursor.close()
         
-        # Limpiar cache relevante
-        query_cache.delete("aforo_stats")
+        # El upsert puede tocar a cualquier participante: descartar también los
+        # datos cacheados por votante, no solo el aforo
+        query_cache.clear()
         
         logger.info(f"Batch insert completed: {rows_affected} participants processed")
         return rows_affected
@@ -606,16 +1315,17 @@ def execute_with_retry(query, params=(), max_retries=3):
             conn = get_db()
             result = execute_query(conn, query, params, commit=True)
             return result
-        except Exception as e:
-            if conn:
-                close_db(conn)
-            
+        except RECOVERABLE_DB_ERRORS + (PoolError,) as e:
             if attempt == max_retries - 1:
                 logger.error(f"Query failed after {max_retries} attempts: {e}")
                 raise
             
             logger.warning(f"Query attempt {attempt + 1} failed: {e}. Retrying...")
-            time.sleep(0.5 * (attempt + 1))  # Backoff progresivo
+        finally:
+            # Devolver siempre la conexión al pool, también en el camino exitoso
+            if conn:
+                close_db(conn)
+        time.sleep(_backoff_delay(0.5, attempt))
 
 # ================================
 # REGISTRAR LIMPIEZA AL FINALIZAR
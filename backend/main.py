@@ -1,100 +1,59 @@
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import HTMLResponse, ORJSONResponse, PlainTextResponse, Response
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import List, Dict
-import json
+import gzip
+import hashlib
+import hmac
+import orjson
 from pathlib import Path
+from urllib.parse import parse_qs
 import os
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 import time
 from contextlib import asynccontextmanager
+import io
+
+try:
+    from isal import igzip
+except ImportError:  # Opcional: sin isal se usa el zlib de la stdlib
+    igzip = None
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # Opcional: solo necesario con PROFILING_TOKEN
+    Profiler = None
 
 # Importar módulos optimizados
-from .database import init_db, health_check, get_pool_status, DB_CONFIG, query_cache
+from .database import init_db, warm_pool, health_check, get_pool_status, DB_CONFIG, query_cache
 from .routers import participants, voting, auth_routes, admin
-from .auth.auth import create_default_admin_from_env, admin_required
+from .auth.auth import default_admin_from_env, admin_required
+from .connection_manager import manager, encode_message
 
 # Configurar logging optimizado
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+
+# La escritura a stderr pasa a un hilo aparte: el event loop solo encola el registro
+_root_logger = logging.getLogger()
+_log_queue = queue.SimpleQueue()
+log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+_root_logger.handlers = [QueueHandler(_log_queue)]
+log_listener.start()
+
 logger = logging.getLogger(__name__)
 
 # Cargar variables de entorno
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
-# ================================
-# WEBSOCKET MANAGER
-# ================================
-
-class ConnectionManager:
-    def __init__(self):
-        self.admin_connections: List[WebSocket] = []
-        self.voter_connections: Dict[str, WebSocket] = {}  # code -> websocket
-        
-    async def connect_admin(self, websocket: WebSocket):
-        await websocket.accept()
-        self.admin_connections.append(websocket)
-        logger.info(f"Admin conectado. Total admins: {len(self.admin_connections)}")
-        
-    async def connect_voter(self, websocket: WebSocket, voter_code: str):
-        await websocket.accept() 
-        self.voter_connections[voter_code] = websocket
-        logger.info(f"Votante {voter_code} conectado. Total votantes: {len(self.voter_connections)}")
-    
-    def disconnect_admin(self, websocket: WebSocket):
-        if websocket in self.admin_connections:
-            self.admin_connections.remove(websocket)
-        logger.info(f"Admin desconectado. Total: {len(self.admin_connections)}")
-    
-    def disconnect_voter(self, voter_code: str):
-        if voter_code in self.voter_connections:
-            del self.voter_connections[voter_code]
-        logger.info(f"Votante {voter_code} desconectado. Total: {len(self.voter_connections)}")
-    
-    async def broadcast_to_admins(self, message: dict):
-        """Enviar mensaje a todos los administradores"""
-        disconnected = []
-        for connection in self.admin_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except:
-                disconnected.append(connection)
-        
-        # Limpiar conexiones muertas
-        for conn in disconnected:
-            self.disconnect_admin(conn)
-    
-    async def broadcast_to_voters(self, message: dict):
-        """Enviar mensaje a todos los votantes"""
-        disconnected = []
-        for code, connection in self.voter_connections.items():
-            try:
-                await connection.send_text(json.dumps(message))
-            except:
-                disconnected.append(code)
-        
-        # Limpiar conexiones muertas
-        for code in disconnected:
-            self.disconnect_voter(code)
-    
-    async def send_to_voter(self, voter_code: str, message: dict):
-        """Enviar mensaje a votante específico"""
-        if voter_code in self.voter_connections:
-            try:
-                await self.voter_connections[voter_code].send_text(json.dumps(message))
-            except:
-                self.disconnect_voter(voter_code)
-
-manager = ConnectionManager()
-
 # Context manager para startup/shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -103,12 +62,16 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 Iniciando aplicación de votación...")
     
     try:
-        # Inicializar base de datos
-        init_db()
-        
-        # Crear administrador por defecto
-        create_default_admin_from_env()
+        # Inicializar base de datos y administrador por defecto en una transacción
+        init_db(default_admin=default_admin_from_env())
+        # Preparar las sentencias calientes antes del primer request
+        warm_pool()
         
+        # Con varios workers (WEB_CONCURRENCY) cada proceso tiene su propio ConnectionManager
+        if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            logger.warning("WEB_CONCURRENCY > 1: los broadcasts por WebSocket solo llegan "
+                           "a los clientes conectados al mismo worker")
+
         # Verificar salud del sistema
         health = health_check()
         if health["status"] != "healthy":
@@ -126,6 +89,9 @@ async def lifespan(app: FastAPI):
     logger.info("🔄 Cerrando aplicación de votación...")
     try:
         logger.info("✅ Aplicación cerrada correctamente")
+        log_listener.stop()  # vacía la cola de logs pendientes
+        # Los logs posteriores (hooks atexit de database) van directo a los handlers
+        _root_logger.handlers = list(log_listener.handlers)
     except Exception as e:
         logger.error(f"Error durante shutdown: {e}")
 
@@ -135,6 +101,7 @@ app = FastAPI(
     description="Sistema completo de votación para asambleas de conjuntos residenciales",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # orjson serializa bastante más rápido que json
     docs_url="/docs" if os.getenv("DEBUG") == "1" else None,
     redoc_url="/redoc" if os.getenv("DEBUG") == "1" else None,
 )
@@ -143,24 +110,180 @@ app = FastAPI(
 # MIDDLEWARE OPTIMIZADO PARA ALTA CARGA
 # ================================
 
+class ProfilingMiddleware:
+    """Con ``?profile=1`` responde el perfil del request (pyinstrument, HTML) en lugar de su resultado.
+
+    Solo GET y solo con el header ``X-Profiling-Token`` igual a PROFILING_TOKEN; se
+    registra únicamente si esa variable existe, así que sin ella no agrega costo alguno.
+    """
+
+    def __init__(self, app, token: str):
+        self.app = app
+        self.token = token.encode()
+
+    def _should_profile(self, scope):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return False
+        if parse_qs(scope["query_string"]).get(b"profile") != [b"1"]:
+            return False
+        token = dict(scope["headers"]).get(b"x-profiling-token", b"")
+        return hmac.compare_digest(token, self.token)
+
+    async def __call__(self, scope, receive, send):
+        if not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        async def discard(message):
+            pass
+
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+        await HTMLResponse(profiler.output_html())(scope, receive, send)
+
+class HostAllowlistMiddleware:
+    """Rechaza (400) hosts no permitidos: un lookup en un set y un endswith, sin recorrer patrones"""
+
+    def __init__(self, app, exact_hosts, suffixes):
+        self.app = app
+        self.exact_hosts = frozenset(host.encode("latin-1") for host in exact_hosts)
+        self.suffixes = tuple(suffix.encode("latin-1") for suffix in suffixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            host = b""
+            for key, value in scope["headers"]:
+                if key == b"host":
+                    host = value.split(b":", 1)[0]
+                    break
+            if host not in self.exact_hosts and not host.endswith(self.suffixes):
+                await PlainTextResponse("Invalid host header", status_code=400)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
 # Seguridad - Trusted hosts
 if os.getenv("RAILWAY_ENVIRONMENT"):
     app.add_middleware(
-        TrustedHostMiddleware,
-        allowed_hosts=[
-            "*.railway.app",
-            "*.up.railway.app", 
-            "web-production-d4d81.up.railway.app",
-            "localhost",
-            "127.0.0.1"
-        ]
+        HostAllowlistMiddleware,
+        exact_hosts=["localhost", "127.0.0.1"],
+        suffixes=[".railway.app"]  # incluye *.up.railway.app y el dominio de producción
     )
 
+# Archivos del frontend servidos ya comprimidos (ver PRECOMPRESSED_ASSETS)
+PRECOMPRESSED_PATHS = frozenset({"/", "/styles.css", "/app.js", "/components.js"})
+
+class GZipResponder:
+    """Responder ASGI que comprime el cuerpo con gzip (mismo comportamiento que el de Starlette).
+
+    Propio en lugar de heredar el de Starlette para poder usar ``igzip`` sin tocar
+    sus atributos internos. Respeta ``Content-Encoding`` ya presente y no comprime
+    cuerpos de una sola parte menores que ``minimum_size``.
+    """
+
+    def __init__(self, app, minimum_size, compresslevel=1, gzip_module=gzip):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.gzip_module = gzip_module
+        self.send = None
+        self.initial_message = None
+        self.started = False
+        self.passthrough = False
+        self.buffer = io.BytesIO()
+        self.gzip_file = None
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        try:
+            await self.app(scope, receive, self.send_with_gzip)
+        finally:
+            if self.gzip_file is not None:
+                self.gzip_file.close()
+
+    def _compress(self, body, finish):
+        if self.gzip_file is None:
+            self.gzip_file = self.gzip_module.GzipFile(
+                mode="wb", fileobj=self.buffer, compresslevel=self.compresslevel
+            )
+        self.gzip_file.write(body)
+        if finish:
+            self.gzip_file.close()
+        else:
+            self.gzip_file.flush()
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    async def send_with_gzip(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Retener la cabecera hasta ver el primer fragmento del cuerpo
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers
+        elif message_type == "http.response.body" and self.passthrough:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+        elif message_type == "http.response.body" and not self.started:
+            self.started = True
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) < self.minimum_size and not more_body:
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers["Content-Encoding"] = "gzip"
+            headers.add_vary_header("Accept-Encoding")
+            message["body"] = self._compress(body, finish=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(message["body"]))
+            await self.send(self.initial_message)
+            await self.send(message)
+        elif message_type == "http.response.body":
+            more_body = message.get("more_body", False)
+            message["body"] = self._compress(message.get("body", b""), finish=not more_body)
+            await self.send(message)
+        else:
+            await self.send(message)
+
+class SelectiveGZipMiddleware:
+    """Equivalente a GZipMiddleware, salvo en las rutas que ya responden comprimidas.
+
+    Usa isal si está instalado (niveles 0-3) y si no el módulo gzip de la stdlib.
+    """
+
+    def __init__(self, app, skip_paths=frozenset(), minimum_size=500, compresslevel=1):
+        self.app = app
+        self.skip_paths = skip_paths
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.gzip_module = igzip if igzip is not None else gzip
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] not in self.skip_paths:
+            if "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+                responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel,
+                                          gzip_module=self.gzip_module)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
 # Compresión GZIP para reducir ancho de banda
 app.add_middleware(
-    GZipMiddleware,
-    minimum_size=1024,
-    compresslevel=6  # Balanceado entre CPU y compresión
+    SelectiveGZipMiddleware,
+    skip_paths=PRECOMPRESSED_PATHS,
+    minimum_size=2048,  # Respuestas JSON pequeñas no compensan el costo
+    compresslevel=1  # La CPU del worker es el recurso escaso; nivel 1 comprime casi igual
 )
 
 # CORS optimizado
@@ -183,21 +306,37 @@ else:
         allow_headers=["*"],
     )
 
+# Perfilado bajo demanda (?profile=1 + X-Profiling-Token), solo para diagnóstico
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+if PROFILING_TOKEN:
+    if Profiler is None:
+        logger.warning("PROFILING_TOKEN definido pero pyinstrument no está instalado")
+    else:
+        app.add_middleware(ProfilingMiddleware, token=PROFILING_TOKEN)
+
 # ================================
 # WEBSOCKET ENDPOINTS
 # ================================
 
+# Heartbeats tal como los serializan JSON.stringify / json.dumps: se comparan sin parsear
+PING_FRAMES = frozenset({'{"type":"ping"}', '{"type": "ping"}'})
+PONG_FRAME = encode_message({"type": "pong"})
+
 @app.websocket("/ws/admin")
 async def websocket_admin(websocket: WebSocket):
-    await manager.connect_admin(websocket)
+    channel = await manager.connect_admin(websocket)
+    loads = orjson.loads  # local: se usa en cada frame
     try:
         while True:
             data = await websocket.receive_text()
+            if data in PING_FRAMES:
+                channel.send(PONG_FRAME)
+                continue
             # Los admins pueden enviar comandos especiales
             try:
-                message = json.loads(data)
+                message = loads(data)
                 if message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
+                    channel.send(PONG_FRAME)
             except:
                 pass
     except WebSocketDisconnect:
@@ -205,19 +344,23 @@ async def websocket_admin(websocket: WebSocket):
 
 @app.websocket("/ws/voter/{voter_code}")
 async def websocket_voter(websocket: WebSocket, voter_code: str):
-    await manager.connect_voter(websocket, voter_code)
+    channel = await manager.connect_voter(websocket, voter_code)
+    loads = orjson.loads  # local: se usa en cada frame
     try:
         while True:
             data = await websocket.receive_text()
+            if data in PING_FRAMES:
+                channel.send(PONG_FRAME)
+                continue
             # Los votantes pueden enviar heartbeat
             try:
-                message = json.loads(data)
+                message = loads(data)
                 if message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
+                    channel.send(PONG_FRAME)
             except:
                 pass
     except WebSocketDisconnect:
-        manager.disconnect_voter(voter_code)
+        manager.disconnect_voter(voter_code, websocket)
 
 # ================================
 # NUEVOS ENDPOINTS ÚTILES
@@ -232,18 +375,45 @@ async def api_status():
         "optimized_for": "400+ concurrent users"
     }
 
+@app.get("/metrics", dependencies=[Depends(admin_required)])
+def metrics():
+    """Métricas en formato de texto de Prometheus (pool, backends PostgreSQL y WebSockets).
+
+    Solo admin: expone el estado interno y cada scrape toma una conexión del pool.
+    """
+    pool = get_pool_status(include_backends=True)
+    lines = [
+        "# TYPE asamblea_db_pool_max gauge",
+        f"asamblea_db_pool_max {DB_CONFIG['maxconn']}",
+    ]
+    for key in ("size", "idle", "in_use", "saturated_seconds", "avg_getconn_us"):
+        if key in pool:
+            lines.append(f"# TYPE asamblea_db_pool_{key} gauge")
+            lines.append(f"asamblea_db_pool_{key} {pool[key]}")
+    for key in ("checkouts", "connects", "exhausted"):
+        if key in pool:
+            lines.append(f"# TYPE asamblea_db_pool_{key}_total counter")
+            lines.append(f"asamblea_db_pool_{key}_total {pool[key]}")
+    if pool.get("backends"):
+        lines.append("# TYPE asamblea_db_backends gauge")
+        for state, count in pool["backends"].items():
+            lines.append(f'asamblea_db_backends{{state="{state}"}} {count}')
+    lines += [
+        "# TYPE asamblea_websocket_connections gauge",
+        f'asamblea_websocket_connections{{role="admin"}} {len(manager.admin_connections)}',
+        f'asamblea_websocket_connections{{role="voter"}} {len(manager.voter_connections)}',
+    ]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 @app.post("/api/notifications/broadcast", dependencies=[Depends(admin_required)])
 async def broadcast_notification(notification: dict):
     """Enviar mensaje a todos los usuarios conectados"""
-    message = {
+    # Enviar a todos
+    await manager.broadcast_all({
         "type": "notification",
         "data": notification,
         "timestamp": time.time()
-    }
-    
-    # Enviar a todos
-    await manager.broadcast_to_admins(message)
-    await manager.broadcast_to_voters(message)
+    })
     
     return {"status": "sent", "targets": {
         "admins": len(manager.admin_connections),
@@ -271,77 +441,87 @@ cache_headers = {
     "X-XSS-Protection": "1; mode=block"
 }
 
+# Frontend en memoria: name -> (bytes originales, versión gzip -9). Se lee y comprime
+# una sola vez al importar; cada request es una búsqueda en el dict, sin stat() ni open()
+PRECOMPRESSED_ASSETS = {}
+
+def _precompress_frontend():
+    for name, _ in FRONTEND_ROUTES.values():
+        file_path = frontend_path / name
+        if file_path.exists():
+            data = file_path.read_bytes()
+            PRECOMPRESSED_ASSETS[name] = (data, gzip.compress(data, compresslevel=9, mtime=0))
+
+# Rutas del frontend: url -> (archivo, media type)
+FRONTEND_ROUTES = {
+    "/": ("index.html", "text/html; charset=utf-8"),
+    "/styles.css": ("styles.css", "text/css; charset=utf-8"),
+    "/app.js": ("app.js", "application/javascript; charset=utf-8"),
+    "/components.js": ("components.js", "application/javascript; charset=utf-8"),
+}
+
+class RawHeadersResponse(Response):
+    """Response con cuerpo y headers ASGI ya armados: no normaliza headers en cada request"""
+
+    def __init__(self, content: bytes, raw_headers: list, status_code: int = 200):
+        self.status_code = status_code
+        self.background = None
+        self.body = content
+        # Copia: otros middlewares (CORS) agregan headers sobre la lista del mensaje
+        self.raw_headers = list(raw_headers)
+
+def _raw_headers(content: bytes, media_type: str, extra: dict) -> list:
+    headers = {**cache_headers, **extra, "Content-Type": media_type, "Content-Length": str(len(content))}
+    return [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in headers.items()]
+
+def _frontend_handler(name: str, media_type: str):
+    """Handler para un archivo del frontend: gzip si el cliente lo acepta, 304 si ya lo tiene
+    (If-None-Match), 404 si no existía al iniciar"""
+    asset = PRECOMPRESSED_ASSETS.get(name)
+    if asset is not None:
+        data, compressed = asset
+        # ETag fuerte por representación: el contenido no cambia hasta el próximo deploy
+        etag = '"' + hashlib.blake2b(data, digest_size=8).hexdigest()
+        variants = {}
+        for gzipped, body, tag in ((False, data, etag + '"'), (True, compressed, etag + '-gz"')):
+            extra = {"Vary": "Accept-Encoding", "ETag": tag}
+            if gzipped:
+                extra["Content-Encoding"] = "gzip"
+            not_modified = [(b"etag", tag.encode()), (b"vary", b"Accept-Encoding"),
+                            (b"cache-control", cache_headers["Cache-Control"].encode())]
+            variants[gzipped] = (body, _raw_headers(body, media_type, extra), tag, not_modified)
+
+    async def serve(request: Request):
+        if asset is None:
+            raise HTTPException(status_code=404, detail=f"Frontend file not found: {name}")
+        headers = request.headers
+        body, raw_headers, tag, not_modified = variants["gzip" in headers.get("accept-encoding", "")]
+        if tag in headers.get("if-none-match", ""):
+            return RawHeadersResponse(b"", not_modified, status_code=304)
+        return RawHeadersResponse(body, raw_headers)
+
+    return serve
+
 # Montar archivos estáticos con configuración optimizada
 if frontend_path.exists():
+    _precompress_frontend()
+
     app.mount(
         "/static", 
         StaticFiles(directory=frontend_path, html=True),
         name="static"
     )
     
-    @app.get("/")
-    async def read_root():
-        """Servir página principal con headers optimizados"""
-        file_path = frontend_path / "index.html"
-        if file_path.exists():
-            return FileResponse(
-                file_path,
-                headers={
-                    **cache_headers,
-                    "Content-Type": "text/html; charset=utf-8"
-                }
-            )
-        return JSONResponse(
-            status_code=404,
-            content={"error": "Frontend file not found"}
-        )
-    
     # Servir archivos específicos con cache optimizado
-    @app.get("/styles.css")
-    async def serve_css():
-        file_path = frontend_path / "styles.css"
-        if file_path.exists():
-            return FileResponse(
-                file_path,
-                headers={
-                    **cache_headers,
-                    "Content-Type": "text/css; charset=utf-8"
-                }
-            )
-        raise HTTPException(status_code=404, detail="CSS file not found")
-    
-    @app.get("/app.js")
-    async def serve_js():
-        file_path = frontend_path / "app.js"
-        if file_path.exists():
-            return FileResponse(
-                file_path,
-                headers={
-                    **cache_headers,
-                    "Content-Type": "application/javascript; charset=utf-8"
-                }
-            )
-        raise HTTPException(status_code=404, detail="JS file not found")
-    
-    @app.get("/components.js")
-    async def serve_components_js():
-        file_path = frontend_path / "components.js"
-        if file_path.exists():
-            return FileResponse(
-                file_path,
-                headers={
-                    **cache_headers,
-                    "Content-Type": "application/javascript; charset=utf-8"
-                }
-            )
-        raise HTTPException(status_code=404, detail="Components JS file not found")
+    for url, (name, media_type) in FRONTEND_ROUTES.items():
+        app.add_api_route(url, _frontend_handler(name, media_type), methods=["GET"], include_in_schema=False)
 
 else:
     logger.warning(f"⚠️ Carpeta frontend no encontrada en {frontend_path}")
     
     @app.get("/")
     async def fallback_root():
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=503,
             content={
                 "error": "Frontend not available",
@@ -353,10 +533,27 @@ else:
 # MANEJO DE ERRORES OPTIMIZADO
 # ================================
 
+# Tracebacks completos por segundo (token bucket): formatearlos es caro y una
+# tormenta de errores no debe inundar el log ni bloquear el event loop
+TRACEBACKS_PER_SECOND = 5
+_traceback_bucket = [time.monotonic(), float(TRACEBACKS_PER_SECOND)]  # [último, tokens]
+
+def _allow_traceback() -> bool:
+    now = time.monotonic()
+    last, tokens = _traceback_bucket
+    tokens = min(TRACEBACKS_PER_SECOND, tokens + (now - last) * TRACEBACKS_PER_SECOND)
+    allowed = tokens >= 1
+    _traceback_bucket[0] = now
+    _traceback_bucket[1] = tokens - 1 if allowed else tokens
+    return allowed
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Manejo global de errores con logging"""
-    logger.error(f"Unhandled exception: {exc}", exc_info=True)
+    if _allow_traceback():
+        logger.error(f"Unhandled exception: {exc}", exc_info=True)
+    else:
+        logger.error(f"Unhandled exception (traceback omitido): {exc!r}")
     
     # No exponer detalles en producción
     if os.getenv("RAILWAY_ENVIRONMENT"):
@@ -364,7 +561,7 @@ async def global_exception_handler(request: Request, exc: Exception):
     else:
         detail = str(exc)
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal Server Error",
@@ -376,7 +573,7 @@ async def global_exception_handler(request: Request, exc: Exception):
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Manejo optimizado de excepciones HTTP"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": exc.detail,
@@ -399,7 +596,8 @@ if __name__ == "__main__":
     uvicorn_config = {
         "host": "0.0.0.0",
         "port": port,
-        "workers": 1,  # Railway funciona mejor con 1 worker
+        # Un worker por defecto: WebSockets y cache en memoria son por proceso
+        "workers": int(os.getenv("WEB_CONCURRENCY", "1")),
         "loop": "uvloop",  # Loop más rápido
         "http": "httptools",  # Parser HTTP más rápido
         "limit_concurrency": 500,
@@ -412,6 +610,7 @@ if __name__ == "__main__":
     # Configuraciones adicionales para desarrollo
     if not os.getenv("RAILWAY_ENVIRONMENT"):
         uvicorn_config.update({
+            "workers": 1,  # reload no admite varios workers
             "reload": True,
             "access_log": True,
             "log_level": "debug"
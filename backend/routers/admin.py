@@ -1,39 +1,79 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException
-from ..database import get_db, execute_query, close_db
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from ..database import (
+    get_conn, execute_query, invalidate_aforo_stats,
+    get_cached_voter_info, get_cached_voter_votes, invalidate_voter_cache
+)
 from ..auth.auth import admin_required
-from pydantic import BaseModel
-from datetime import datetime
+from ..connection_manager import manager
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Literal
+import time
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 logger = logging.getLogger(__name__)
 
+# Payloads inmutables y sin textos desmedidos (los campos extra se ignoran, como antes)
+REQUEST_CONFIG = ConfigDict(frozen=True, str_max_length=1000)
+
 class EditVoterRequest(BaseModel):
+    model_config = REQUEST_CONFIG
     is_power: bool
 
 class BroadcastMessage(BaseModel):
-    text: str
-    type: str = "info"  # info, success, warning, error
-    duration: int = 5000  # milisegundos
+    model_config = REQUEST_CONFIG
+    text: str = Field(min_length=1)
+    type: Literal["info", "success", "warning", "error"] = "info"
+    duration: int = Field(default=5000, ge=0, le=60000)  # milisegundos
 
 class EditVoteRequest(BaseModel):
+    model_config = REQUEST_CONFIG
     new_answer: str
 
-@router.delete("/delete-code/{code}", dependencies=[Depends(admin_required)])
-async def delete_participant_code(code: str):
-    """
-    Eliminar registro de asistencia de un código específico.
-    Solo elimina el registro de presente, no de la base de participantes.
-    """
-    conn = get_db()
-    try:
-        # Verificar que el participante existe
-        participant = execute_query(
-            conn,
-            "SELECT code, name, present FROM participants WHERE code = ?",
-            (code,),
-            fetchone=True
-        )
+# Quitar asistencia en un solo round-trip: si el participante está presente, borrar sus
+# votos y resetearlo. Devuelve la fila previa (ninguna = no existe; present = 0 = sin asistencia)
+REMOVE_ATTENDANCE_SQL = """
+    WITH p AS (
+        SELECT code, name, present FROM participants WHERE code = ?
+    ), u AS (
+        UPDATE participants SET present = 0, has_voted = 0, is_power = NULL
+        WHERE code = (SELECT code FROM p WHERE present <> 0)
+        RETURNING code
+    ), d AS (
+        DELETE FROM votes WHERE participant_code = (SELECT code FROM u)
+    )
+    SELECT name, present FROM p
+"""
+
+# Borrar un voto, contar los restantes y resetear has_voted si no queda ninguno, en un
+# solo round-trip. Todas las partes ven el mismo snapshot (anterior al DELETE), por eso
+# el conteo descuenta las filas borradas.
+CLEAR_VOTE_SQL = """
+    WITH d AS (
+        DELETE FROM votes WHERE participant_code = ? AND question_id = ?
+        RETURNING participant_code
+    ), r AS (
+        SELECT COUNT(*) - (SELECT COUNT(*) FROM d) AS remaining
+        FROM votes WHERE participant_code = ?
+    ), u AS (
+        UPDATE participants p SET has_voted = 0
+        FROM r
+        WHERE p.code = ? AND r.remaining = 0 AND p.has_voted <> 0
+          AND EXISTS (SELECT 1 FROM d)
+        RETURNING p.code
+    )
+    SELECT (SELECT COUNT(*) FROM d) AS deleted,
+           (SELECT remaining FROM r) AS remaining,
+           (SELECT COUNT(*) FROM u) AS flagged
+"""
+
+def _eliminar_asistencia(code):
+    """Quitar asistencia y votos de un código (bloqueante: se ejecuta en el threadpool)"""
+    with get_conn() as conn:
+        # Verificar, eliminar votos y marcar como no presente (una sentencia, un commit)
+        participant = execute_query(conn, REMOVE_ATTENDANCE_SQL, (code,), fetchone=True, commit=True)
         
         if not participant:
             raise HTTPException(status_code=404, detail="Código no encontrado en el sistema")
@@ -41,204 +81,157 @@ async def delete_participant_code(code: str):
         if not participant["present"]:
             raise HTTPException(status_code=400, detail="Este código no tiene registro de asistencia")
         
-        # Eliminar votos del participante
-        execute_query(
-            conn,
-            "DELETE FROM votes WHERE participant_code = ?",
-            (code,),
-            commit=True
-        )
-        
-        # Marcar como no presente y resetear has_voted
-        execute_query(
-            conn,
-            "UPDATE participants SET present = 0, has_voted = 0, is_power = NULL WHERE code = ?",
-            (code,),
-            commit=True
-        )
-        
-        # WEBSOCKET: Notificar eliminación de código
-        from ..main import manager
-        await manager.broadcast_to_admins({
-            "type": "participant_removed",
-            "data": {"code": code, "name": participant["name"]}
-        })
-        
-        return {
-            "status": "codigo eliminado",
-            "code": code,
-            "name": participant["name"]
-        }
-        
+        invalidate_aforo_stats()
+        invalidate_voter_cache(code)
+        return participant["name"]
+
+@router.delete("/delete-code/{code}", dependencies=[Depends(admin_required)])
+async def delete_participant_code(code: str):
+    """
+    Eliminar registro de asistencia de un código específico.
+    Solo elimina el registro de presente, no de la base de participantes.
+    """
+    try:
+        # Las consultas no deben bloquear el event loop que atiende los WebSockets
+        name = await run_in_threadpool(_eliminar_asistencia, code)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error eliminando código {code}: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
+    
+    # WEBSOCKET: Notificar eliminación de código
+    await manager.broadcast_to_admins({
+        "type": "participant_removed",
+        "data": {"code": code, "name": name}
+    })
+    
+    return {
+        "status": "codigo eliminado",
+        "code": code,
+        "name": name
+    }
 
 @router.get("/voter-info/{code}", dependencies=[Depends(admin_required)])
 def get_voter_info(code: str):
     """Obtener información de un votante específico"""
-    conn = get_db()
     try:
+        participant = get_cached_voter_info(code)
+    except Exception as e:
+        logger.error(f"Error obteniendo info del votante {code}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    
+    if not participant:
+        raise HTTPException(status_code=404, detail="Código no encontrado")
+    
+    # Solo tipos primitivos (TEXT/REAL/INTEGER): orjson directo, sin pasar por jsonable_encoder
+    return ORJSONResponse(participant)
+
+def _editar_votante(code, is_power):
+    """Cambiar el tipo de participación (bloqueante: se ejecuta en el threadpool)"""
+    with get_conn() as conn:
+        # Actualizar tipo de participación; sin fila devuelta el código no existe
         participant = execute_query(
             conn,
-            "SELECT code, name, coefficient, present, is_power, has_voted FROM participants WHERE code = ?",
-            (code,),
-            fetchone=True
+            "UPDATE participants SET is_power = ? WHERE code = ? RETURNING name",
+            (is_power, code),
+            fetchone=True,
+            commit=True
         )
         
         if not participant:
             raise HTTPException(status_code=404, detail="Código no encontrado")
         
-        return dict(participant)
-        
-    except Exception as e:
-        logger.error(f"Error obteniendo info del votante {code}: {e}")
-        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
+        invalidate_aforo_stats()
+        invalidate_voter_cache(code)
+        return participant["name"]
 
 @router.put("/edit-voter/{code}", dependencies=[Depends(admin_required)])
 async def edit_voter_info(code: str, request: EditVoterRequest):
     """Editar información de un votante (cambiar entre propio/poder)"""
-    conn = get_db()
     try:
-        # Verificar que el participante existe
-        participant = execute_query(
-            conn,
-            "SELECT code, name, present FROM participants WHERE code = ?",
-            (code,),
-            fetchone=True
-        )
-        
-        if not participant:
-            raise HTTPException(status_code=404, detail="Código no encontrado")
-        
-        # Actualizar tipo de participación
-        execute_query(
-            conn,
-            "UPDATE participants SET is_power = ? WHERE code = ?",
-            (request.is_power, code),
-            commit=True
-        )
-        
-        # WEBSOCKET: Notificar cambio de votante
-        from ..main import manager
-        await manager.broadcast_to_admins({
-            "type": "voter_edited",
-            "data": {
-                "code": code,
-                "name": participant["name"],
-                "is_power": request.is_power
-            }
-        })
-        
-        return {
-            "status": "actualizado",
-            "code": code,
-            "name": participant["name"],
-            "is_power": request.is_power
-        }
-        
+        name = await run_in_threadpool(_editar_votante, code, request.is_power)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error editando votante {code}: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
+    
+    # WEBSOCKET: Notificar cambio de votante
+    await manager.broadcast_to_admins({
+        "type": "voter_edited",
+        "data": {
+            "code": code,
+            "name": name,
+            "is_power": request.is_power
+        }
+    })
+    
+    return {
+        "status": "actualizado",
+        "code": code,
+        "name": name,
+        "is_power": request.is_power
+    }
 
 @router.get("/voter-votes/{code}", dependencies=[Depends(admin_required)])
 def get_voter_votes(code: str):
     """Obtener todos los votos de un participante"""
-    conn = get_db()
     try:
-        votes = execute_query(
-            conn,
-            """SELECT v.question_id, v.answer, q.text as question_text, v.timestamp
-               FROM votes v
-               JOIN questions q ON v.question_id = q.id
-               WHERE v.participant_code = ?
-               ORDER BY v.timestamp""",
-            (code,),
-            fetchall=True
-        )
-        
-        return [dict(vote) for vote in votes]
-        
+        return ORJSONResponse(get_cached_voter_votes(code))
     except Exception as e:
         logger.error(f"Error obteniendo votos del participante {code}: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
 
-@router.delete("/clear-vote/{code}/{question_id}", dependencies=[Depends(admin_required)])
-async def clear_voter_vote(code: str, question_id: int):
-    """Eliminar el voto de un participante en una pregunta específica"""
-    conn = get_db()
-    try:
-        # Verificar que el voto existe
-        vote = execute_query(
-            conn,
-            "SELECT * FROM votes WHERE participant_code = ? AND question_id = ?",
-            (code, question_id),
-            fetchone=True
-        )
-        
-        if not vote:
-            raise HTTPException(status_code=404, detail="Voto no encontrado")
-        
-        # Eliminar el voto
-        execute_query(
+def _eliminar_voto(code, question_id):
+    """Eliminar un voto y devolver cuántos le quedan al participante (bloqueante: threadpool)"""
+    with get_conn() as conn:
+        result = execute_query(
             conn,
-            "DELETE FROM votes WHERE participant_code = ? AND question_id = ?",
-            (code, question_id),
+            CLEAR_VOTE_SQL,
+            (code, question_id, code, code),
+            fetchone=True,
             commit=True
         )
         
-        # Actualizar has_voted si es necesario
-        remaining_votes = execute_query(
-            conn,
-            "SELECT COUNT(*) as count FROM votes WHERE participant_code = ?",
-            (code,),
-            fetchone=True
-        )
-        
-        if remaining_votes["count"] == 0:
-            execute_query(
-                conn,
-                "UPDATE participants SET has_voted = 0 WHERE code = ?",
-                (code,),
-                commit=True
-            )
-        
-        # WEBSOCKET: Notificar voto eliminado
-        from ..main import manager
-        await manager.broadcast_to_admins({
-            "type": "vote_cleared",
-            "data": {
-                "code": code,
-                "question_id": question_id,
-                "remaining_votes": remaining_votes["count"]
-            }
-        })
-        
-        return {
-            "status": "voto eliminado",
-            "code": code,
-            "question_id": question_id
-        }
+        if not result["deleted"]:
+            raise HTTPException(status_code=404, detail="Voto no encontrado")
         
+        if result["flagged"]:
+            invalidate_aforo_stats()
+        invalidate_voter_cache(code)
+        return result["remaining"]
+
+@router.delete("/clear-vote/{code}/{question_id}", dependencies=[Depends(admin_required)])
+async def clear_voter_vote(code: str, question_id: int):
+    """Eliminar el voto de un participante en una pregunta específica"""
+    try:
+        remaining = await run_in_threadpool(_eliminar_voto, code, question_id)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error eliminando voto {code}/{question_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
+    
+    # WEBSOCKET: Notificar voto eliminado
+    await manager.broadcast_to_admins({
+        "type": "vote_cleared",
+        "data": {
+            "code": code,
+            "question_id": question_id,
+            "remaining_votes": remaining
+        }
+    })
+    
+    return {
+        "status": "voto eliminado",
+        "code": code,
+        "question_id": question_id
+    }
 
-@router.put("/edit-vote/{code}/{question_id}", dependencies=[Depends(admin_required)])
-async def edit_voter_vote(code: str, question_id: int, request: EditVoteRequest):
-    """Editar el voto de un participante en una pregunta específica"""
-    conn = get_db()
-    try:
+def _editar_voto(code, question_id, new_answer):
+    """Cambiar la respuesta de un voto y devolver la anterior (bloqueante: threadpool)"""
+    with get_conn() as conn:
         # Verificar que el voto existe
         vote = execute_query(
             conn,
@@ -254,50 +247,58 @@ async def edit_voter_vote(code: str, question_id: int, request: EditVoteRequest)
         option = execute_query(
             conn,
             "SELECT * FROM options WHERE question_id = ? AND option_text = ?",
-            (question_id, request.new_answer),
+            (question_id, new_answer),
             fetchone=True
         )
         
         if not option:
-            raise HTTPException(status_code=400, detail=f"Opción '{request.new_answer}' no válida para esta pregunta")
+            raise HTTPException(status_code=400, detail=f"Opción '{new_answer}' no válida para esta pregunta")
         
-        # Actualizar el voto
+        # Actualizar el voto (timestamp calculado en el servidor, mismo formato que isoformat() UTC)
         execute_query(
             conn,
-            "UPDATE votes SET answer = ?, timestamp = ? WHERE participant_code = ? AND question_id = ?",
-            (request.new_answer, datetime.utcnow().isoformat(), code, question_id),
+            """UPDATE votes
+               SET answer = ?,
+                   timestamp = to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US')
+               WHERE participant_code = ? AND question_id = ?""",
+            (new_answer, code, question_id),
             commit=True
         )
-        
-        # WEBSOCKET: Notificar voto editado
-        from ..main import manager
-        await manager.broadcast_to_admins({
-            "type": "vote_edited",
-            "data": {
-                "code": code,
-                "question_id": question_id,
-                "old_answer": vote["answer"],
-                "new_answer": request.new_answer
-            }
-        })
-        
-        return {
-            "status": "voto actualizado",
+        invalidate_voter_cache(code)
+        return vote["answer"]
+
+@router.put("/edit-vote/{code}/{question_id}", dependencies=[Depends(admin_required)])
+async def edit_voter_vote(code: str, question_id: int, request: EditVoteRequest):
+    """Editar el voto de un participante en una pregunta específica"""
+    try:
+        old_answer = await run_in_threadpool(_editar_voto, code, question_id, request.new_answer)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error editando voto {code}/{question_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    
+    # WEBSOCKET: Notificar voto editado
+    await manager.broadcast_to_admins({
+        "type": "vote_edited",
+        "data": {
             "code": code,
             "question_id": question_id,
+            "old_answer": old_answer,
             "new_answer": request.new_answer
         }
-        
-    except Exception as e:
-        logger.error(f"Error editando voto {code}/{question_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
+    })
+    
+    return {
+        "status": "voto actualizado",
+        "code": code,
+        "question_id": question_id,
+        "new_answer": request.new_answer
+    }
 
 @router.post("/broadcast-message", dependencies=[Depends(admin_required)])
 async def broadcast_message_to_voters(message: BroadcastMessage):
     """Enviar mensaje específico solo a votantes conectados"""
-    from ..main import manager
     
     # Enviar solo a votantes
     await manager.broadcast_to_voters({
@@ -306,7 +307,7 @@ async def broadcast_message_to_voters(message: BroadcastMessage):
             "text": message.text,
             "type": message.type,
             "duration": message.duration,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": time.time()
         }
     })
     
@@ -1,30 +1,41 @@
 import logging
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 from psycopg2 import IntegrityError
-from ..database import get_db, execute_query, close_db
+from ..database import (
+    get_db, execute_query, close_db, db_conn, invalidate_aforo_stats, invalidate_voter_cache,
+    PARTICIPANT_BY_CODE_SQL
+)
 from ..auth.auth import (
     create_access_token,
-    verify_password,
+    verify_and_update_password_async,
+    update_user_password_hash,
     get_user_by_username,
     get_password_hash,
+    invalidate_user,
     admin_required,
     voter_required,
 )
+from ..connection_manager import manager
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 logger = logging.getLogger(__name__)
 
 # ---------- Schemas ----------
+# Campos extra se ignoran (contrato previo); el rol se valida en el handler para
+# conservar el 400 "Role inválido" en lugar del 422 genérico de pydantic
 class RegisterUser(BaseModel):
+    model_config = ConfigDict(frozen=True, str_max_length=128)
     username: str
     password: str
     role: str  # 'admin' or 'voter'
 
 class VoterLoginRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, str_max_length=128)
     code: str
     is_power: bool = False
 
@@ -47,18 +58,28 @@ def register_user(payload: RegisterUser):
     finally:
         close_db(conn)
 
+    invalidate_user(payload.username)
+
     return {"msg": f"Usuario '{payload.username}' creado con rol '{payload.role}'"}
 
 # ---------- Admin login (using form because OAuth2PasswordRequestForm expects form-data) ----------
 @router.post("/login/admin")
-def login_admin(
+async def login_admin(
     username: Annotated[str, Form()],
-    password: Annotated[str, Form()]
+    password: Annotated[str, Form()],
 ):
-    user = get_user_by_username(username)
-    if not user or not verify_password(password, user["password_hash"]):
+    # Sin conexión del pool cuando el usuario está en cache
+    user = await run_in_threadpool(get_user_by_username, username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    # Verificación CPU-bound en un pool dedicado, sin bloquear el event loop
+    valid, new_hash = await verify_and_update_password_async(password, user["password_hash"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
-    token = create_access_token({"sub": user["username"], "role": "admin"})
+    if new_hash:
+        # Migrar hashes pbkdf2_sha256 antiguos a argon2
+        await run_in_threadpool(update_user_password_hash, username, new_hash)
+    token = create_access_token({"sub": username, "role": "admin"})
     return {"access_token": token, "token_type": "bearer"}
 
 @router.get("/check-database")
@@ -79,22 +100,21 @@ def check_database_status():
 @router.post("/login/voter")
 def login_voter(data: VoterLoginRequest):
     conn = get_db()
-    
-    # Verificar que haya participantes en la base
-    total_participants = execute_query(
-        conn,
-        "SELECT COUNT(*) as count FROM participants",
-        fetchone=True
-    )
+    try:
+        # Verificar que haya participantes en la base
+        total_participants = execute_query(
+            conn,
+            "SELECT COUNT(*) as count FROM participants",
+            fetchone=True
+        )
 
-    if total_participants["count"] == 0:
-        raise HTTPException(status_code=400, detail="No hay participantes registrados en el sistema")
+        if total_participants["count"] == 0:
+            raise HTTPException(status_code=400, detail="No hay participantes registrados en el sistema")
 
-    try:
         # 1. Validar que el participante existe Y ya tiene asistencia
         participant = execute_query(
             conn,
-            "SELECT code, name, is_power, present, coefficient FROM participants WHERE code = ?",
+            PARTICIPANT_BY_CODE_SQL,
             (data.code,),
             fetchone=True
         )
@@ -125,10 +145,8 @@ def login_voter(data: VoterLoginRequest):
         close_db(conn)
 
 # ---------- Nuevas dependencias de login ----------
-@router.post("/register-attendance")
-async def register_attendance(data: VoterLoginRequest):
-    conn = get_db()
-    
+def _registrar_asistencia(conn, data):
+    """Validar y marcar la asistencia (bloqueante: se ejecuta en el threadpool)"""
     # Verificar que haya participantes en la base
     total_participants = execute_query(
         conn,
@@ -139,34 +157,41 @@ async def register_attendance(data: VoterLoginRequest):
     if total_participants["count"] == 0:
         raise HTTPException(status_code=400, detail="No hay participantes registrados en el sistema. Debe cargar la base de datos primero.")
 
-    try:
-        # 1. Validar que el participante existe
-        participant = execute_query(
-            conn,
-            "SELECT code, name, present, is_power, coefficient FROM participants WHERE code = ?",
-            (data.code,),
-            fetchone=True
-        )
-        if not participant:
-            raise HTTPException(status_code=404, detail="Código no encontrado")
+    # 1. Validar que el participante existe
+    participant = execute_query(
+        conn,
+        PARTICIPANT_BY_CODE_SQL,
+        (data.code,),
+        fetchone=True
+    )
+    if not participant:
+        raise HTTPException(status_code=404, detail="Código no encontrado")
 
-        # 2. Verificar si ya está registrado
-        if participant.get("present") == 1:
-            raise HTTPException(status_code=400, detail="Ya tiene asistencia registrada")
+    # 2. Verificar si ya está registrado
+    if participant.get("present") == 1:
+        raise HTTPException(status_code=400, detail="Ya tiene asistencia registrada")
 
-        # 3. Registrar asistencia con datos fijos (no modificables después)
-        login_timestamp = datetime.now().isoformat()
-        execute_query(
-            conn,
-            """UPDATE participants 
-                SET present = 1, is_power = ?, login_time = ? 
-                WHERE code = ?""",
-            (data.is_power, login_timestamp, data.code),
-            commit=True
-        )
+    # 3. Registrar asistencia con datos fijos (no modificables después)
+    login_timestamp = datetime.now().isoformat()
+    execute_query(
+        conn,
+        """UPDATE participants 
+            SET present = 1, is_power = ?, login_time = ? 
+            WHERE code = ?""",
+        (data.is_power, login_timestamp, data.code),
+        commit=True
+    )
+    invalidate_aforo_stats()
+    invalidate_voter_cache(data.code)
+    return participant, login_timestamp
+
+@router.post("/register-attendance")
+async def register_attendance(data: VoterLoginRequest, conn=Depends(db_conn)):
+    try:
+        # Las consultas no deben bloquear el event loop que atiende los WebSockets
+        participant, login_timestamp = await run_in_threadpool(_registrar_asistencia, conn, data)
 
         # WEBSOCKET: Notificar nueva asistencia registrada
-        from ..main import manager
         await manager.broadcast_to_admins({
             "type": "attendance_registered",
             "data": {
@@ -191,5 +216,3 @@ async def register_attendance(data: VoterLoginRequest):
     except Exception as e:
         logger.error(f"Error en register_attendance: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
\ No newline at end of file
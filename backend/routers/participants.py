@@ -2,8 +2,10 @@ import logging
 import re
 import pandas as pd
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from ..database import get_db, execute_query, close_db
+from fastapi.concurrency import run_in_threadpool
+from ..database import get_db, get_conn, execute_query, execute_values_query, close_db, batch_insert_participants, query_cache
 from ..auth.auth import admin_required
+from ..connection_manager import manager
 from typing import Dict
 from fastapi.responses import StreamingResponse
 from fpdf import FPDF
@@ -38,30 +40,38 @@ class ConjuntoRequest(BaseModel):
 def listar_participantes():
     conn = get_db()
     try:
-        participants = execute_query(conn, "SELECT * FROM participants", fetchall=True)
+        participants = execute_query(
+            conn,
+            # Mismas columnas que el SELECT * original, en orden explícito
+            """SELECT code, name, coefficient, has_voted, present, is_power, login_time,
+                      created_at, updated_at
+               FROM participants""",
+            fetchall=True
+        )
         return [dict(p) for p in participants]
     finally:
         close_db(conn)
 
-# Guardar nombre del conjunto
-@router.post("/conjunto/nombre", dependencies=[Depends(admin_required)])
-async def guardar_nombre_conjunto(request: ConjuntoRequest):
-    conn = get_db()
-    try:
+def _guardar_nombre_conjunto(nombre):
+    """Guardar el nombre del conjunto en config (bloqueante: se ejecuta en el threadpool)"""
+    with get_conn() as conn:
         execute_query(
             conn,
             "INSERT INTO config (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
-            ("conjunto_nombre", request.nombre),
+            ("conjunto_nombre", nombre),
             commit=True
         )
-        from ..main import manager
-        await manager.broadcast_to_admins({
-            "type": "conjunto_name_updated",
-            "data": {"nombre": request.nombre}
-        })
-        return {"status": "ok"}
-    finally:
-        close_db(conn)
+
+# Guardar nombre del conjunto
+@router.post("/conjunto/nombre", dependencies=[Depends(admin_required)])
+async def guardar_nombre_conjunto(request: ConjuntoRequest):
+    # Las consultas no deben bloquear el event loop que atiende los WebSockets
+    await run_in_threadpool(_guardar_nombre_conjunto, request.nombre)
+    await manager.broadcast_to_admins({
+        "type": "conjunto_name_updated",
+        "data": {"nombre": request.nombre}
+    })
+    return {"status": "ok"}
 
 # Obtener nombre conjunto
 @router.get("/conjunto/nombre", dependencies=[Depends(admin_required)])
@@ -86,35 +96,22 @@ def obtener_nombre_conjunto_publico():
 # Carga masiva desde JSON
 @router.post("/bulk", dependencies=[Depends(admin_required)])
 async def agregar_participantes(data: Dict[str, dict]):
-    conn = get_db()
     count = 0
-    try:
-        for code, info in data.items():
-            name = info.get("nombre") or info.get("name")
-            coef = info.get("coeficiente") or info.get("coefficient") or 1.0
-            ha_votado = int(bool(info.get("ha_votado", False)))
-            if not code or not name:
-                continue
-            execute_query(
-                conn,
-                """
-                INSERT INTO participants (code, name, coefficient, has_voted, present)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT (code) DO UPDATE SET 
-                    name = EXCLUDED.name,
-                    coefficient = EXCLUDED.coefficient,
-                    has_voted = EXCLUDED.has_voted,
-                    present = EXCLUDED.present
-                """,
-                (code.upper(), name, float(coef), ha_votado, 0),
-                commit=True
-            )
-            count += 1
-        from ..main import manager
-        await manager.broadcast_to_admins({"type": "participants_bulk_loaded", "data": {"count": count}})
-        return {"status": "ok", "inserted": count, "message": f"✅ {count} participantes cargados exitosamente", "total_participants": count}
-    finally:
-        close_db(conn)
+    rows = []
+    for code, info in data.items():
+        name = info.get("nombre") or info.get("name")
+        coef = info.get("coeficiente") or info.get("coefficient") or 1.0
+        ha_votado = int(bool(info.get("ha_votado", False)))
+        if not code or not name:
+            continue
+        rows.append({"code": code.upper(), "name": name, "coefficient": float(coef), "has_voted": ha_votado})
+        count += 1
+
+    # COPY FROM STDIN + un solo upsert, fuera del event loop
+    await run_in_threadpool(batch_insert_participants, rows)
+
+    await manager.broadcast_to_admins({"type": "participants_bulk_loaded", "data": {"count": count}})
+    return {"status": "ok", "inserted": count, "message": f"✅ {count} participantes cargados exitosamente", "total_participants": count}
 
 
 def extraer_torre_id(df, sheet_name):
@@ -166,11 +163,12 @@ def extraer_torre_id(df, sheet_name):
     return "1"  # Fallback final
 
 
-# Endpoint para subir un XLSX desde admin
-@router.post("/upload-xlsx", dependencies=[Depends(admin_required)])
-async def upload_xlsx(file: UploadFile = File(...)):
+def _cargar_xlsx(contents):
+    """Leer las hojas del Excel y hacer upsert de los participantes (bloqueante: threadpool).
+
+    Devuelve ``(insertados, hojas_procesadas)``.
+    """
     try:
-        contents = await file.read()
         xls = pd.read_excel(BytesIO(contents), sheet_name=None, header=None)
     except Exception as e:
         logger.error(f"Error leyendo Excel: {type(e).__name__}: {e}", exc_info=True)
@@ -215,39 +213,45 @@ async def upload_xlsx(file: UploadFile = File(...)):
                 continue
 
     # Insertar en DB
-    conn = get_db()
-    inserted = 0
-    try:
-        for code, info in participantes.items():
-            execute_query(
-                conn,
-                """
-                INSERT INTO participants (code, name, coefficient, has_voted, present)
-                VALUES (?, ?, ?, ?, 0)
-                ON CONFLICT (code) DO UPDATE SET
-                    name = EXCLUDED.name,
-                    coefficient = EXCLUDED.coefficient,
-                    has_voted = EXCLUDED.has_voted
-                """,
-                (code.upper(), info["nombre"], float(info["coeficiente"]), int(info.get("ha_votado", False))),
-                commit=True
-            )
-            inserted += 1
-
-        from ..main import manager
-        await manager.broadcast_to_admins({
-            "type": "excel_uploaded",
-            "data": {"inserted": inserted, "sheets_processed": len(xls.keys())}
-        })
+    rows = {}
+    for code, info in participantes.items():
+        rows[code.upper()] = (code.upper(), info["nombre"], float(info["coeficiente"]), int(info.get("ha_votado", False)), 0)
 
-        return {"status": "ok", "inserted": inserted, "sheets_processed": len(xls.keys())}
-    finally:
-        close_db(conn)
+    with get_conn() as conn:
+        execute_values_query(
+            conn,
+            """
+            INSERT INTO participants (code, name, coefficient, has_voted, present)
+            VALUES %s
+            ON CONFLICT (code) DO UPDATE SET
+                name = EXCLUDED.name,
+                coefficient = EXCLUDED.coefficient,
+                has_voted = EXCLUDED.has_voted
+            """,
+            list(rows.values())
+        )
+    # Aforo y datos cacheados por votante de todos los códigos cargados
+    query_cache.clear()
+    return len(participantes), len(xls.keys())
+
+# Endpoint para subir un XLSX desde admin
+@router.post("/upload-xlsx", dependencies=[Depends(admin_required)])
+async def upload_xlsx(file: UploadFile = File(...)):
+    contents = await file.read()
+    # pandas y el upsert son bloqueantes: fuera del event loop
+    inserted, sheets_processed = await run_in_threadpool(_cargar_xlsx, contents)
+
+    await manager.broadcast_to_admins({
+        "type": "excel_uploaded",
+        "data": {"inserted": inserted, "sheets_processed": sheets_processed}
+    })
+
+    return {"status": "ok", "inserted": inserted, "sheets_processed": sheets_processed}
 
 
 # Genera PDF de asistencia
 @router.post("/asistencia/pdf")
-async def generar_pdf_asistencia(user=Depends(admin_required)):
+def generar_pdf_asistencia(user=Depends(admin_required)):
     colombia_tz = timezone(timedelta(hours=-5))
     fecha_actual = datetime.now(colombia_tz)
     conn = get_db()
@@ -293,14 +297,6 @@ async def generar_pdf_asistencia(user=Depends(admin_required)):
         if preguntas:
             for pregunta in preguntas:
                 try:
-                    opciones_result = execute_query(
-                        conn,
-                        "SELECT option_text FROM options WHERE question_id = ? ORDER BY option_text",
-                        (pregunta['id'],),
-                        fetchall=True
-                    )
-                    opciones = [r["option_text"] for r in opciones_result] if opciones_result else []
-
                     total_participants_result = execute_query(
                         conn,
                         "SELECT COUNT(DISTINCT participant_code) as total_participants FROM votes WHERE question_id = ?",
@@ -321,25 +317,35 @@ async def generar_pdf_asistencia(user=Depends(admin_required)):
                     )
                     total_participant_coefficient = float(total_coef_result["total_participant_coefficient"]) if total_coef_result else 0.0
 
+                    # Todas las opciones con su conteo en una sola consulta
+                    opciones_result = execute_query(
+                        conn,
+                        """
+                        SELECT
+                            o.option_text,
+                            COUNT(DISTINCT p.code) as unique_voters,
+                            COALESCE(SUM(DISTINCT p.coefficient), 0) as coefficient_sum
+                        FROM options o
+                        LEFT JOIN votes v
+                            ON v.question_id = o.question_id
+                            AND (v.answer = o.option_text
+                                 OR v.answer LIKE o.option_text || ',%%'
+                                 OR v.answer LIKE '%%, ' || o.option_text || ',%%'
+                                 OR v.answer LIKE '%%, ' || o.option_text)
+                        LEFT JOIN participants p ON v.participant_code = p.code
+                        WHERE o.question_id = ?
+                        GROUP BY o.id, o.option_text
+                        ORDER BY o.option_text
+                        """,
+                        (pregunta['id'],),
+                        fetchall=True
+                    ) or []
+
                     resultados = []
-                    for opcion in opciones:
-                        result = execute_query(
-                            conn,
-                            """
-                            SELECT 
-                                COUNT(DISTINCT v.participant_code) as unique_voters,
-                                COALESCE(SUM(DISTINCT p.coefficient), 0) as coefficient_sum
-                            FROM votes v
-                            JOIN participants p ON v.participant_code = p.code
-                            WHERE v.question_id = ? 
-                            AND (v.answer = ? OR v.answer LIKE ? OR v.answer LIKE ? OR v.answer LIKE ?)
-                            """,
-                            (pregunta['id'], opcion, f"{opcion},%", f"%, {opcion},%", f"%, {opcion}"),
-                            fetchone=True
-                        )
-                        votes = int(result['unique_voters']) if result and result['unique_voters'] else 0
-                        coefficient_sum = float(result['coefficient_sum']) if result and result['coefficient_sum'] else 0.0
-                        resultados.append({'answer': opcion, 'votes': votes, 'coefficient_sum': coefficient_sum})
+                    for result in opciones_result:
+                        votes = int(result['unique_voters']) if result['unique_voters'] else 0
+                        coefficient_sum = float(result['coefficient_sum']) if result['coefficient_sum'] else 0.0
+                        resultados.append({'answer': result['option_text'], 'votes': votes, 'coefficient_sum': coefficient_sum})
 
                     resultados.sort(key=lambda x: x['coefficient_sum'], reverse=True)
                     resultados_preguntas.append({
@@ -500,7 +506,12 @@ async def generar_pdf_asistencia(user=Depends(admin_required)):
 
 
 @router.post("/asistencia/xlsx")
-async def generar_xlsx_asistencia(user=Depends(admin_required)):
+def generar_xlsx_asistencia(user=Depends(admin_required)):
+    """Exportar la asistencia a Excel.
+
+    ``def`` (threadpool): recorrer el cursor del servidor y armar el libro es
+    bloqueante. La conexión se devuelve al pool antes de serializar el libro.
+    """
     colombia_tz = timezone(timedelta(hours=-5))
     fecha_actual = datetime.now(colombia_tz)
     conn = get_db()
@@ -509,18 +520,6 @@ async def generar_xlsx_asistencia(user=Depends(admin_required)):
         conjunto_result = execute_query(conn, "SELECT value FROM config WHERE key = ?", ("conjunto_nombre",), fetchone=True)
         conjunto_name = conjunto_result["value"] if conjunto_result and conjunto_result.get("value") else "Conjunto Residencial"
 
-        participantes = execute_query(
-            conn,
-            "SELECT code, name, coefficient, present, is_power, login_time FROM participants ORDER BY code",
-            fetchall=True
-        )
-    except Exception as e:
-        logger.error(f"Error en generar_xlsx_asistencia: {e}")
-        raise HTTPException(status_code=500, detail=f"Error obteniendo datos: {str(e)}")
-    finally:
-        close_db(conn)
-
-    try:
         wb = Workbook()
         ws = wb.active
         ws.title = "Asistencia"
@@ -533,6 +532,13 @@ async def generar_xlsx_asistencia(user=Depends(admin_required)):
             cell.font = Font(bold=True)
             cell.alignment = Alignment(horizontal='center')
 
+        # Recorrer los participantes con un cursor del servidor en lugar de cargarlos todos
+        participantes = execute_query(
+            conn,
+            "SELECT code, name, coefficient, present, is_power, login_time FROM participants ORDER BY code",
+            stream=True
+        )
+
         row_num = 5
         for p in participantes:
             fecha_ingreso = "-"
@@ -554,7 +560,13 @@ async def generar_xlsx_asistencia(user=Depends(admin_required)):
             ws.cell(row=row_num, column=5, value="SI" if p.get("present") else "NO")
             ws.cell(row=row_num, column=6, value=("Si" if p.get("is_power") else "No") if p.get("present") else "-")
             row_num += 1
+    except Exception as e:
+        logger.error(f"Error en generar_xlsx_asistencia: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo datos: {str(e)}")
+    finally:
+        close_db(conn)
 
+    try:
         buffer = BytesIO()
         wb.save(buffer)
         buffer.seek(0)
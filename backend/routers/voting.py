@@ -1,9 +1,15 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List
-from ..database import get_db, execute_query, close_db
+from psycopg2.extras import NamedTupleCursor
+from ..database import (
+    get_db, get_conn, db_conn, execute_query, execute_values_query, close_db, cached_query, query_cache,
+    get_cached_aforo_stats, record_vote, OPEN_QUESTION_SQL, VALID_OPTIONS_SQL
+)
 from ..auth.auth import admin_required, voter_required, admin_or_voter_required
+from ..connection_manager import manager
 from datetime import datetime, timedelta, timezone
 
 router = APIRouter(prefix="/voting", tags=["Voting"])
@@ -26,6 +32,34 @@ class ExtendTimeRequest(BaseModel):
     extra_minutes: int
 
 # --- Crear pregunta (admin) ---
+def _crear_pregunta(payload, typ, allow_multiple, max_selections, time_limit, expires_at):
+    """Insertar la pregunta y sus opciones (bloqueante: se ejecuta en el threadpool)"""
+    with get_conn() as conn:
+        # MODIFICAR query para incluir campos de cronómetro
+        question = execute_query(
+            conn,
+            """INSERT INTO questions (text, type, active, allow_multiple, max_selections, time_limit_minutes, expires_at) 
+            VALUES (?, ?, 1, ?, ?, ?, ?) RETURNING id""",
+            (payload.text, typ, int(allow_multiple), max_selections, time_limit, expires_at),
+            fetchone=True
+        )
+        qid = question["id"]
+
+        # Insertar opciones en un solo INSERT multi-fila
+        if typ == "yesno":
+            option_texts = ["Sí", "No"]
+        else:
+            if not payload.options or len(payload.options) < 2:
+                raise HTTPException(status_code=400, detail="Las preguntas 'multiple' requieren al menos 2 opciones")
+            option_texts = payload.options
+        execute_values_query(
+            conn,
+            "INSERT INTO options (question_id, option_text) VALUES %s",
+            [(qid, opt) for opt in option_texts]
+        )
+        invalidate_active_questions()
+        return qid
+
 @router.post("/questions", dependencies=[Depends(admin_required)])
 async def crear_pregunta(payload: QuestionCreate):
     typ = payload.type.lower()
@@ -48,54 +82,32 @@ async def crear_pregunta(payload: QuestionCreate):
     if hasattr(payload, 'time_limit_minutes') and payload.time_limit_minutes and payload.time_limit_minutes > 0:
         time_limit = payload.time_limit_minutes if payload.time_limit_minutes else None
         expires_at = (datetime.utcnow() + timedelta(minutes=time_limit)).isoformat()
-    conn = get_db()
-    try:
-        # MODIFICAR query para incluir campos de cronómetro
-        question = execute_query(
-            conn,
-            """INSERT INTO questions (text, type, active, allow_multiple, max_selections, time_limit_minutes, expires_at) 
-            VALUES (?, ?, 1, ?, ?, ?, ?) RETURNING id""",
-            (payload.text, typ, int(allow_multiple), max_selections, time_limit, expires_at),
-            fetchone=True
-        )
-        qid = question["id"]
-
-        # Insertar opciones (sin cambios)
-        if typ == "yesno":
-            execute_query(conn, "INSERT INTO options (question_id, option_text) VALUES (?, ?)", (qid, "Sí"), commit=True)
-            execute_query(conn, "INSERT INTO options (question_id, option_text) VALUES (?, ?)", (qid, "No"), commit=True)
-        else:
-            if not payload.options or len(payload.options) < 2:
-                raise HTTPException(status_code=400, detail="Las preguntas 'multiple' requieren al menos 2 opciones")
-            for opt in payload.options:
-                execute_query(conn, "INSERT INTO options (question_id, option_text) VALUES (?, ?)", (qid, opt), commit=True)
-        
-        # WEBSOCKET: Notificar nueva votación
-        from ..main import manager
-        await manager.broadcast_to_voters({
-            "type": "new_question",
-            "data": {"question_id": qid, "text": payload.text, "type": typ}
-        })
-        await manager.broadcast_to_admins({
-            "type": "question_created", 
-            "data": {"question_id": qid, "text": payload.text}
-        })
-        
-        return {
-            "status": "ok", 
-            "id": qid,
-            "expires_at": expires_at,
-            "time_limit_minutes": payload.time_limit_minutes
-        }
-    finally:
-        close_db(conn)
 
-# AGREGAR endpoint para verificar votaciones expiradas
-@router.post("/questions/check-expired", dependencies=[Depends(admin_required)])
-async def check_expired_questions():
-    """Verificar y cerrar automáticamente votaciones que expiraron"""
-    conn = get_db()
-    try:
+    # Las consultas no deben bloquear el event loop que atiende los WebSockets
+    qid = await run_in_threadpool(
+        _crear_pregunta, payload, typ, allow_multiple, max_selections, time_limit, expires_at
+    )
+    
+    # WEBSOCKET: Notificar nueva votación
+    await manager.broadcast_to_voters({
+        "type": "new_question",
+        "data": {"question_id": qid, "text": payload.text, "type": typ}
+    })
+    await manager.broadcast_to_admins({
+        "type": "question_created", 
+        "data": {"question_id": qid, "text": payload.text}
+    })
+    
+    return {
+        "status": "ok", 
+        "id": qid,
+        "expires_at": expires_at,
+        "time_limit_minutes": payload.time_limit_minutes
+    }
+
+def _cerrar_expiradas():
+    """Cerrar las votaciones vencidas y devolverlas (bloqueante: se ejecuta en el threadpool)"""
+    with get_conn() as conn:
         current_time = datetime.utcnow().isoformat()
         
         # Encontrar votaciones expiradas
@@ -110,7 +122,6 @@ async def check_expired_questions():
             fetchall=True
         )
         
-        expired_count = 0
         for question in expired_questions:
             # Cerrar la votación
             execute_query(
@@ -119,43 +130,44 @@ async def check_expired_questions():
                 (question["id"],),
                 commit=True
             )
-            expired_count += 1
             logger.info(f"Votación {question['id']} cerrada automáticamente por expiración")
         
-        # WEBSOCKET: Notificar votaciones cerradas por tiempo
-        if expired_count > 0:
-            from ..main import manager
-            for question in expired_questions:
-                await manager.broadcast_to_voters({
-                    "type": "question_expired",
-                    "data": {"question_id": question["id"], "text": question["text"]}
-                })
-            await manager.broadcast_to_admins({
-                "type": "questions_expired",
-                "data": {"count": expired_count, "questions": [dict(q) for q in expired_questions]}
-            })
-        
-        return {
-            "status": "ok",
-            "expired_questions": expired_count,
-            "expired_details": [dict(q) for q in expired_questions]
-        }
-        
+        if expired_questions:
+            invalidate_active_questions()
+        return [dict(q) for q in expired_questions]
+
+# AGREGAR endpoint para verificar votaciones expiradas
+@router.post("/questions/check-expired", dependencies=[Depends(admin_required)])
+async def check_expired_questions():
+    """Verificar y cerrar automáticamente votaciones que expiraron"""
+    try:
+        expired_questions = await run_in_threadpool(_cerrar_expiradas)
     except Exception as e:
         logger.error(f"Error verificando votaciones expiradas: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
-
-@router.put("/questions/{question_id}/extend-time", dependencies=[Depends(admin_required)])
-async def extend_question_time(question_id: int, request: ExtendTimeRequest):
-    """Extender el tiempo de una votación activa"""
-    extra_minutes = request.extra_minutes
-    if extra_minutes <= 0 or extra_minutes > 120:  # Máximo 2 horas extra
-        raise HTTPException(status_code=400, detail="Los minutos extra deben estar entre 1 y 120")
+    expired_count = len(expired_questions)
     
-    conn = get_db()
-    try:
+    # WEBSOCKET: Notificar votaciones cerradas por tiempo
+    if expired_count > 0:
+        for question in expired_questions:
+            await manager.broadcast_to_voters({
+                "type": "question_expired",
+                "data": {"question_id": question["id"], "text": question["text"]}
+            })
+        await manager.broadcast_to_admins({
+            "type": "questions_expired",
+            "data": {"count": expired_count, "questions": expired_questions}
+        })
+    
+    return {
+        "status": "ok",
+        "expired_questions": expired_count,
+        "expired_details": expired_questions
+    }
+
+def _extender_tiempo(question_id, extra_minutes):
+    """Reabrir si hace falta y mover la expiración (bloqueante: se ejecuta en el threadpool)"""
+    with get_conn() as conn:
         # Verificar que la pregunta existe y está activa
         question = execute_query(
             conn,
@@ -192,246 +204,237 @@ async def extend_question_time(question_id: int, request: ExtendTimeRequest):
             (new_expires_iso, new_total_minutes, question_id),
             commit=True
         )
-        
-        # WEBSOCKET: Notificar extensión de tiempo
-        from ..main import manager
-        await manager.broadcast_to_voters({
-            "type": "time_extended",
-            "data": {
-                "question_id": question_id,
-                "text": question["text"],
-                "extra_minutes": extra_minutes,
-                "new_expires_at": new_expires_iso,
-                "message": f"Se extendió el tiempo de votación por {extra_minutes} minutos adicionales"
-            }
-        })
-        
-        await manager.broadcast_to_admins({
-            "type": "time_extended",
-            "data": {
-                "question_id": question_id,
-                "extra_minutes": extra_minutes,
-                "new_total_minutes": new_total_minutes
-            }
-        })
-        
-        return {
-            "status": "tiempo extendido",
+        invalidate_active_questions()
+        return question["text"], new_expires_iso, new_total_minutes
+
+@router.put("/questions/{question_id}/extend-time", dependencies=[Depends(admin_required)])
+async def extend_question_time(question_id: int, request: ExtendTimeRequest):
+    """Extender el tiempo de una votación activa"""
+    extra_minutes = request.extra_minutes
+    if extra_minutes <= 0 or extra_minutes > 120:  # Máximo 2 horas extra
+        raise HTTPException(status_code=400, detail="Los minutos extra deben estar entre 1 y 120")
+    
+    try:
+        text, new_expires_iso, new_total_minutes = await run_in_threadpool(
+            _extender_tiempo, question_id, extra_minutes
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error extendiendo tiempo de pregunta {question_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    
+    # WEBSOCKET: Notificar extensión de tiempo
+    await manager.broadcast_to_voters({
+        "type": "time_extended",
+        "data": {
             "question_id": question_id,
+            "text": text,
             "extra_minutes": extra_minutes,
             "new_expires_at": new_expires_iso,
-            "total_minutes": new_total_minutes
+            "message": f"Se extendió el tiempo de votación por {extra_minutes} minutos adicionales"
         }
-        
-    except Exception as e:
-        logger.error(f"Error extendiendo tiempo de pregunta {question_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
+    })
+    
+    await manager.broadcast_to_admins({
+        "type": "time_extended",
+        "data": {
+            "question_id": question_id,
+            "extra_minutes": extra_minutes,
+            "new_total_minutes": new_total_minutes
+        }
+    })
+    
+    return {
+        "status": "tiempo extendido",
+        "question_id": question_id,
+        "extra_minutes": extra_minutes,
+        "new_expires_at": new_expires_iso,
+        "total_minutes": new_total_minutes
+    }
 
 # --- Obtener preguntas activas (votante) ---
-@router.get("/questions/active", dependencies=[Depends(admin_or_voter_required)])
-async def preguntas_activas():
+@cached_query("active_questions", ttl=2)
+def _load_active_questions():
+    """Preguntas activas con sus opciones en una sola consulta.
+
+    Cacheadas unos segundos: todos los votantes consultan este endpoint y cada
+    escritura sobre preguntas u opciones invalida el cache.
+    """
     conn = get_db()
     try:
-        # Consulta mejorada que incluye las opciones
-        qs = execute_query(
+        return execute_query(
             conn,
             """
-            SELECT DISTINCT
+            SELECT
                 q.id, q.text, q.type, q.closed, q.allow_multiple, q.max_selections, 
-                q.time_limit_minutes, q.expires_at
+                q.time_limit_minutes, q.expires_at,
+                COALESCE(
+                    json_agg(json_build_object('text', o.option_text) ORDER BY o.id)
+                        FILTER (WHERE o.id IS NOT NULL),
+                    '[]'
+                ) AS options
             FROM questions q 
+            LEFT JOIN options o ON o.question_id = q.id
             WHERE q.active = 1
+            GROUP BY q.id
             ORDER BY q.id DESC
             """,
             fetchall=True
         )
-        
-        out = []
-        for q in qs:
-            # Calcular tiempo restante correctamente
-            time_remaining = None
-            is_expired = False
-            
-            if q["time_limit_minutes"] and q["expires_at"]:
-                try:
-                    # Parsear correctamente la fecha
-                    expires_str = q["expires_at"]
-                    if expires_str.endswith('Z'):
-                        expires_str = expires_str[:-1] + '+00:00'
-                    expires_at = datetime.fromisoformat(expires_str)
-                    if expires_at.tzinfo is None:
-                        expires_at = expires_at.replace(tzinfo=timezone.utc)
-                    
-                    # Usar UTC para ambas fechas
-                    current_dt = datetime.now(timezone.utc)
-                    
-                    if current_dt >= expires_at:
-                        if q["closed"] == 0:
-                            time_remaining = 0
-                            is_expired = True
-                            # Auto-cerrar
-                            execute_query(
-                                conn,
-                                "UPDATE questions SET closed = 1 WHERE id = ?",
-                                (q["id"],),
-                                commit=True
-                            )
-                        else:
-                            time_remaining = 0
-                            is_expired = True
-                    else:
-                        # Calcular segundos restantes
-                        diff = expires_at - current_dt
-                        time_remaining = max(0, int(diff.total_seconds()))
-                        is_expired = False
-                except Exception as e:
-                    logger.error(f"Error calculando tiempo para pregunta {q['id']}: {e}")
-                    time_remaining = 0
-                    is_expired = True
-            else:
-                time_remaining = None
-                is_expired = False
-            
-            # SIEMPRE obtener opciones
-            options = execute_query(
-                conn,
-                "SELECT option_text as text FROM options WHERE question_id = ? ORDER BY id",
-                (q["id"],),
-                fetchall=True
-            )
-            
-            # Crear objeto de pregunta con TODAS las opciones
-            question_data = {
-                "id": q["id"],
-                "text": q["text"],
-                "type": q["type"],
-                "closed": bool(q["closed"]) or is_expired,
-                "allow_multiple": bool(q["allow_multiple"]),
-                "max_selections": q["max_selections"],
-                "time_limit_minutes": q["time_limit_minutes"],
-                "expires_at": q["expires_at"],
-                "time_remaining_seconds": time_remaining,
-                "is_expired": is_expired,
-                "options": [{"text": o["text"]} for o in options] if options else []
-            }
-            
-            out.append(question_data)
-            
-        return out
     finally:
         close_db(conn)
 
-# --- Votar (votante) ---
-@router.post("/vote", dependencies=[Depends(voter_required)])
-async def votar(vote: VoteIn, user=Depends(voter_required)):
-    participant_code = user.get("code") or user.get("sub")
-    if not participant_code:
-        raise HTTPException(status_code=400, detail="Código de votante no encontrado en token")
-    
+def invalidate_active_questions():
+    """Descartar las preguntas activas cacheadas tras modificar questions u options"""
+    query_cache.delete(_load_active_questions.cache_key())
+
+def _close_expired_question(question_id):
     conn = get_db()
     try:
-        q = execute_query(
-            conn,
-            "SELECT * FROM questions WHERE id = ? AND active = 1 AND closed = 0",
-            (vote.question_id,),
-            fetchone=True
-        )
-        if not q:
-            raise HTTPException(status_code=404, detail="Pregunta no encontrada, no activa o cerrada")
-
-        # Verificar doble voto
-        existing = execute_query(
-            conn,
-            "SELECT * FROM votes WHERE participant_code = ? AND question_id = ?",
-            (participant_code, vote.question_id),
-            fetchone=True
-        )
-        if existing:
-            raise HTTPException(status_code=400, detail="Ya votó en esta pregunta")
-
-        # Normalizar respuesta (siempre convertir a lista)
-        if isinstance(vote.answer, str):
-            answers = [vote.answer]
-        else:
-            answers = vote.answer
-
-        # Validar selección múltiple
-        if q["allow_multiple"]:
-            if len(answers) > q["max_selections"]:
-                raise HTTPException(status_code=400, detail=f"No puede seleccionar más de {q['max_selections']} opciones")
-        else:
-            if len(answers) > 1:
-                raise HTTPException(status_code=400, detail="Esta pregunta solo permite una selección")
-
-        # Validar que todas las opciones existan
-        for answer in answers:
-            opt = execute_query(
-                conn,
-                "SELECT * FROM options WHERE question_id = ? AND option_text = ?",
-                (vote.question_id, answer),
-                fetchone=True
-            )
-            if not opt:
-                raise HTTPException(status_code=400, detail=f"Opción inválida: {answer}")
-
-        # Insertar UN SOLO voto con respuestas separadas por comas
-        timestamp = datetime.utcnow().isoformat()
-        answer_string = ", ".join(answers)  # "Ana López, Diana Torres"
         execute_query(
             conn,
-            "INSERT INTO votes (participant_code, question_id, answer, timestamp) VALUES (?, ?, ?, ?)",
-            (participant_code, vote.question_id, answer_string, timestamp),
+            "UPDATE questions SET closed = 1 WHERE id = ?",
+            (question_id,),
             commit=True
         )
+    finally:
+        close_db(conn)
+    invalidate_active_questions()
 
-        # Actualizar has_voted si votó en todas las preguntas activas
-        active_qs = execute_query(
-            conn,
-            "SELECT id FROM questions WHERE active = 1",
-            fetchall=True
-        )
-        active_ids = [r["id"] for r in active_qs]
-        if active_ids:
-            # Contar preguntas en las que ya votó
-            placeholders = ",".join(["?"] * len(active_ids))
-            voted_questions = execute_query(
-                conn,
-                f"SELECT DISTINCT question_id FROM votes WHERE participant_code = ? AND question_id IN ({placeholders})",
-                tuple([participant_code] + active_ids),
-                fetchall=True
-            )
-            
-            if len(voted_questions) == len(active_ids):
-                execute_query(
-                    conn,
-                    "UPDATE participants SET has_voted = 1 WHERE code = ?",
-                    (participant_code,),
-                    commit=True
-                )
-
-        # WEBSOCKET: Notificar voto registrado
-        from ..main import manager
-        await manager.broadcast_to_admins({
-            "type": "vote_registered",
-            "data": {
-                "participant_code": participant_code, 
-                "question_id": vote.question_id,
-                "answer": answer_string,
-                "timestamp": timestamp
-            }
-        })
+@router.get("/questions/active", dependencies=[Depends(admin_or_voter_required)])
+def preguntas_activas():
+    qs = _load_active_questions()
+
+    out = []
+    for q in qs:
+        # Calcular tiempo restante correctamente (por request: no depende del cache)
+        time_remaining = None
+        is_expired = False
+        
+        if q["time_limit_minutes"] and q["expires_at"]:
+            try:
+                # Parsear correctamente la fecha
+                expires_str = q["expires_at"]
+                if expires_str.endswith('Z'):
+                    expires_str = expires_str[:-1] + '+00:00'
+                expires_at = datetime.fromisoformat(expires_str)
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+                
+                # Usar UTC para ambas fechas
+                current_dt = datetime.now(timezone.utc)
+                
+                if current_dt >= expires_at:
+                    time_remaining = 0
+                    is_expired = True
+                    if q["closed"] == 0:
+                        # Auto-cerrar
+                        _close_expired_question(q["id"])
+                else:
+                    # Calcular segundos restantes
+                    diff = expires_at - current_dt
+                    time_remaining = max(0, int(diff.total_seconds()))
+                    is_expired = False
+            except Exception as e:
+                logger.error(f"Error calculando tiempo para pregunta {q['id']}: {e}")
+                time_remaining = 0
+                is_expired = True
+        
+        # Crear objeto de pregunta con TODAS las opciones
+        question_data = {
+            "id": q["id"],
+            "text": q["text"],
+            "type": q["type"],
+            "closed": bool(q["closed"]) or is_expired,
+            "allow_multiple": bool(q["allow_multiple"]),
+            "max_selections": q["max_selections"],
+            "time_limit_minutes": q["time_limit_minutes"],
+            "expires_at": q["expires_at"],
+            "time_remaining_seconds": time_remaining,
+            "is_expired": is_expired,
+            "options": q["options"]
+        }
         
-        # Notificar al votante específico
-        await manager.send_to_voter(participant_code, {
-            "type": "vote_confirmed",
-            "data": {"question_id": vote.question_id, "answers": answers}
-        })
+        out.append(question_data)
+        
+    return out
 
-        return {"status": "voto registrado", "answers": answers}
-    finally:
-        close_db(conn)
+# --- Votar (votante) ---
+def _registrar_voto(conn, participant_code, vote):
+    """Validar y registrar el voto (bloqueante: se ejecuta en el threadpool)"""
+    q = execute_query(
+        conn,
+        OPEN_QUESTION_SQL,
+        (vote.question_id,),
+        fetchone=True
+    )
+    if not q:
+        raise HTTPException(status_code=404, detail="Pregunta no encontrada, no activa o cerrada")
+
+    # Normalizar respuesta (siempre convertir a lista)
+    if isinstance(vote.answer, str):
+        answers = [vote.answer]
+    else:
+        answers = vote.answer
+
+    # Validar selección múltiple
+    if q["allow_multiple"]:
+        if len(answers) > q["max_selections"]:
+            raise HTTPException(status_code=400, detail=f"No puede seleccionar más de {q['max_selections']} opciones")
+    else:
+        if len(answers) > 1:
+            raise HTTPException(status_code=400, detail="Esta pregunta solo permite una selección")
+
+    # Validar que todas las opciones existan (una sola consulta con ANY)
+    valid_options = execute_query(
+        conn,
+        VALID_OPTIONS_SQL,
+        (vote.question_id, list(answers)),
+        fetchall=True
+    )
+    valid_texts = {o["option_text"] for o in valid_options}
+    for answer in answers:
+        if answer not in valid_texts:
+            raise HTTPException(status_code=400, detail=f"Opción inválida: {answer}")
+
+    # Insertar UN SOLO voto con respuestas separadas por comas
+    timestamp = datetime.utcnow().isoformat()
+    answer_string = ", ".join(answers)  # "Ana López, Diana Torres"
+    # Voto + has_voted en un solo round-trip; la PK (participant_code, question_id)
+    # impide el doble voto
+    if not record_vote(conn, participant_code, vote.question_id, answer_string, timestamp):
+        raise HTTPException(status_code=400, detail="Ya votó en esta pregunta")
+
+    return answers, answer_string, timestamp
+
+@router.post("/vote", dependencies=[Depends(voter_required)])
+async def votar(vote: VoteIn, user=Depends(voter_required), conn=Depends(db_conn)):
+    participant_code = user.get("code") or user.get("sub")
+    if not participant_code:
+        raise HTTPException(status_code=400, detail="Código de votante no encontrado en token")
+
+    # Las consultas no deben bloquear el event loop que atiende los WebSockets
+    answers, answer_string, timestamp = await run_in_threadpool(_registrar_voto, conn, participant_code, vote)
+
+    # WEBSOCKET: Notificar voto registrado
+    await manager.broadcast_to_admins({
+        "type": "vote_registered",
+        "data": {
+            "participant_code": participant_code, 
+            "question_id": vote.question_id,
+            "answer": answer_string,
+            "timestamp": timestamp
+        }
+    })
+    
+    # Notificar al votante específico
+    await manager.send_to_voter(participant_code, {
+        "type": "vote_confirmed",
+        "data": {"question_id": vote.question_id, "answers": answers}
+    })
+
+    return {"status": "voto registrado", "answers": answers}
 
 # --- Votos individuales por persona ---
 @router.get("/my-votes", dependencies=[Depends(voter_required)])
@@ -450,10 +453,9 @@ def mis_votos(user=Depends(voter_required)):
         close_db(conn)
 
 # --- Pausar encuestas creadas ---
-@router.put("/questions/{question_id}/toggle", dependencies=[Depends(admin_required)])
-async def toggle_question_status(question_id: int):
-    conn = get_db()
-    try:
+def _alternar_pregunta(question_id):
+    """Abrir o cerrar una pregunta; devuelve (texto, cerrada) (bloqueante: threadpool)"""
+    with get_conn() as conn:
         # Obtener estado actual con información completa
         question = execute_query(
             conn,
@@ -492,6 +494,8 @@ async def toggle_question_status(question_id: int):
                 commit=True
             )
         
+        invalidate_active_questions()
+
         # Obtener nuevo estado
         new_status = execute_query(
             conn,
@@ -499,43 +503,46 @@ async def toggle_question_status(question_id: int):
             (question_id,),
             fetchone=True
         )
-        
-        # WEBSOCKET: Solo UNA notificación
-        from ..main import manager
-        await manager.broadcast_to_admins({
-            "type": "question_toggled",
-            "data": {
-                "question_id": question_id,
-                "closed": bool(new_status["closed"])
-            }
-        })
+        return question["text"], bool(new_status["closed"])
 
-        # Notificar también a los votantes
-        await manager.broadcast_to_voters({
-            "type": "question_toggled",
-            "data": {
-                "question_id": question_id,
-                "closed": bool(new_status["closed"]),
-                "text": question["text"]
-            }
-        })
-        
-        return {
-            "status": "actualizado",
-            "question_id": question_id,
-            "closed": bool(new_status["closed"])
-        }
-        
+@router.put("/questions/{question_id}/toggle", dependencies=[Depends(admin_required)])
+async def toggle_question_status(question_id: int):
+    try:
+        text, closed = await run_in_threadpool(_alternar_pregunta, question_id)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error toggle pregunta {question_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
-    finally:
-        close_db(conn)
-# --- Borrar encuestas ---
-@router.delete("/questions/{question_id}", dependencies=[Depends(admin_required)])
-async def delete_question(question_id: int):
-    conn = get_db()
-    try:
+    
+    # WEBSOCKET: Solo UNA notificación
+    await manager.broadcast_to_admins({
+        "type": "question_toggled",
+        "data": {
+            "question_id": question_id,
+            "closed": closed
+        }
+    })
+
+    # Notificar también a los votantes
+    await manager.broadcast_to_voters({
+        "type": "question_toggled",
+        "data": {
+            "question_id": question_id,
+            "closed": closed,
+            "text": text
+        }
+    })
+    
+    return {
+        "status": "actualizado",
+        "question_id": question_id,
+        "closed": closed
+    }
+
+def _borrar_pregunta(question_id):
+    """Borrar votos, opciones y la pregunta; devuelve su texto (bloqueante: threadpool)"""
+    with get_conn() as conn:
         # Verificar que existe
         question = execute_query(
             conn,
@@ -550,27 +557,30 @@ async def delete_question(question_id: int):
         execute_query(conn, "DELETE FROM votes WHERE question_id = ?", (question_id,), commit=True)
         execute_query(conn, "DELETE FROM options WHERE question_id = ?", (question_id,), commit=True)
         execute_query(conn, "DELETE FROM questions WHERE id = ?", (question_id,), commit=True)
-        
-        # WEBSOCKET: Notificar eliminación de pregunta
-        from ..main import manager
-        await manager.broadcast_to_voters({
-            "type": "question_deleted",
-            "data": {"question_id": question_id, "text": question["text"]}
-        })
-        await manager.broadcast_to_admins({
-            "type": "question_deleted",
-            "data": {"question_id": question_id}
-        })
-        
-        return {"status": "pregunta eliminada"}
-    finally:
-        close_db(conn)
+        # Los votos borrados pueden ser de cualquier votante: vaciar el cache completo
+        query_cache.clear()
+        return question["text"]
 
-# --- Editar pregunta cerrada (admin) ---
-@router.put("/questions/{question_id}", dependencies=[Depends(admin_required)])
-async def editar_pregunta(question_id: int, payload: dict):
-    conn = get_db()
-    try:
+# --- Borrar encuestas ---
+@router.delete("/questions/{question_id}", dependencies=[Depends(admin_required)])
+async def delete_question(question_id: int):
+    text = await run_in_threadpool(_borrar_pregunta, question_id)
+    
+    # WEBSOCKET: Notificar eliminación de pregunta
+    await manager.broadcast_to_voters({
+        "type": "question_deleted",
+        "data": {"question_id": question_id, "text": text}
+    })
+    await manager.broadcast_to_admins({
+        "type": "question_deleted",
+        "data": {"question_id": question_id}
+    })
+    
+    return {"status": "pregunta eliminada"}
+
+def _editar_pregunta(question_id, payload):
+    """Actualizar texto, opciones y max_selections; devuelve el texto final (bloqueante: threadpool)"""
+    with get_conn() as conn:
         # Verificar que la pregunta existe y está cerrada
         question = execute_query(
             conn,
@@ -602,13 +612,11 @@ async def editar_pregunta(question_id: int, payload: dict):
             execute_query(conn, "DELETE FROM options WHERE question_id = ?", (question_id,), commit=True)
             
             # Insertar nuevas opciones
-            for option in payload["options"]:
-                execute_query(
-                    conn,
-                    "INSERT INTO options (question_id, option_text) VALUES (?, ?)",
-                    (question_id, option),
-                    commit=True
-                )
+            execute_values_query(
+                conn,
+                "INSERT INTO options (question_id, option_text) VALUES %s",
+                [(question_id, option) for option in payload["options"]]
+            )
         
         # Actualizar max_selections si se proporciona
         if "max_selections" in payload:
@@ -619,91 +627,83 @@ async def editar_pregunta(question_id: int, payload: dict):
                 commit=True
             )
         
-        # WEBSOCKET: Notificar edición de pregunta
-        from ..main import manager
-        updated_text = payload.get("text", question["text"])
-        await manager.broadcast_to_admins({
-            "type": "question_edited",
-            "data": {"question_id": question_id, "text": updated_text}
-        })
-        
-        return {"status": "pregunta actualizada"}
+        # El texto de la pregunta también va en los votos cacheados por votante
+        query_cache.clear()
+        return payload.get("text", question["text"])
+
+# --- Editar pregunta cerrada (admin) ---
+@router.put("/questions/{question_id}", dependencies=[Depends(admin_required)])
+async def editar_pregunta(question_id: int, payload: dict):
+    updated_text = await run_in_threadpool(_editar_pregunta, question_id, payload)
+
+    # WEBSOCKET: Notificar edición de pregunta
+    await manager.broadcast_to_admins({
+        "type": "question_edited",
+        "data": {"question_id": question_id, "text": updated_text}
+    })
     
-    finally:
-        close_db(conn)
+    return {"status": "pregunta actualizada"}
 
 # --- Resultados (admin) ---
 @router.get("/results/{question_id}", dependencies=[Depends(admin_required)])
 def resultados(question_id: int):
     conn = get_db()
     try:
-        # Verificar pregunta
+        # Pregunta + totales en un solo round-trip (antes eran cuatro consultas)
         q = execute_query(
             conn,
-            "SELECT id, text, type FROM questions WHERE id = ?",
+            """
+            SELECT
+                q.id, q.text, q.type,
+                (SELECT COUNT(DISTINCT participant_code) FROM votes WHERE question_id = q.id) as unique_voters,
+                (SELECT COALESCE(SUM(p.coefficient), 0)
+                 FROM (SELECT DISTINCT participant_code FROM votes WHERE question_id = q.id) v
+                 JOIN participants p ON v.participant_code = p.code) as total_participant_weight,
+                (SELECT COUNT(*) FROM participants) as total_registered
+            FROM questions q
+            WHERE q.id = ?
+            """,
             (question_id,),
             fetchone=True
         )
         if not q:
             raise HTTPException(status_code=404, detail="Pregunta no encontrada")
 
-        # Obtener todas las opciones (incluso las que no tengan votos)
-        opts_result = execute_query(
-            conn,
-            "SELECT option_text FROM options WHERE question_id = ? ORDER BY option_text",
-            (question_id,),
-            fetchall=True
-        )
-        opts = [r["option_text"] for r in opts_result]
+        unique_voters = q["unique_voters"] or 0
+        total_participant_weight = float(q["total_participant_weight"] or 0)
+        total_registered = q["total_registered"] or 0
 
-        # Obtener número de participantes únicos que votaron en esta pregunta
-        unique_voters_result = execute_query(
-            conn,
-            "SELECT COUNT(DISTINCT participant_code) as unique_voters FROM votes WHERE question_id = ?",
-            (question_id,),
-            fetchone=True
-        )
-        unique_voters = unique_voters_result["unique_voters"] if unique_voters_result else 0
-
-        # Obtener coeficiente total de participantes únicos
-        total_weight_result = execute_query(
+        # Conteo de todas las opciones (incluso sin votos) en una sola consulta:
+        # cada opción se busca dentro del string de respuestas separadas por comas
+        option_rows = execute_query(
             conn,
             """
-            SELECT COALESCE(SUM(p.coefficient), 0) as total_participant_weight 
-            FROM (SELECT DISTINCT participant_code FROM votes WHERE question_id = ?) v
-            JOIN participants p ON v.participant_code = p.code
+            SELECT
+                o.option_text,
+                COUNT(p.code) as participants,
+                COALESCE(SUM(p.coefficient), 0) as weight
+            FROM options o
+            LEFT JOIN votes v
+                ON v.question_id = o.question_id
+                AND (v.answer = o.option_text
+                     OR v.answer LIKE o.option_text || ',%%'
+                     OR v.answer LIKE '%%, ' || o.option_text || ',%%'
+                     OR v.answer LIKE '%%, ' || o.option_text)
+            LEFT JOIN participants p ON v.participant_code = p.code
+            WHERE o.question_id = ?
+            GROUP BY o.id, o.option_text
+            ORDER BY o.option_text
             """,
             (question_id,),
-            fetchone=True
+            fetchall=True,
+            cursor_factory=NamedTupleCursor
         )
-        total_participant_weight = float(total_weight_result["total_participant_weight"]) if total_weight_result else 0.0
 
-        # Para cada opción, buscar si está en el string de respuestas
         rows = []
-        for opt in opts:
-            result = execute_query(
-                conn,
-                """
-                SELECT 
-                    COUNT(v.participant_code) as participants,
-                    COALESCE(SUM(p.coefficient), 0) as weight
-                FROM votes v
-                JOIN participants p ON v.participant_code = p.code
-                WHERE v.question_id = ? 
-                AND (v.answer = ? OR v.answer LIKE ? OR v.answer LIKE ? OR v.answer LIKE ?)
-                """,
-                (question_id, opt, f"{opt},%", f"%, {opt},%", f"%, {opt}"),
-                fetchone=True
-            )
-            
-            if result:
-                participants = int(result["participants"]) if result["participants"] else 0
-                weight = float(result["weight"]) if result["weight"] else 0.0
-            else:
-                participants = 0
-                weight = 0.0
-                
-            rows.append({"option": opt, "participants": participants, "weight": weight})
+        for result in option_rows:
+            participants = int(result.participants) if result.participants else 0
+            weight = float(result.weight) if result.weight else 0.0
+            rows.append({"option": result.option_text, "participants": participants, "weight": weight})
 
         # Convertir results a lista para el frontend
         results_list = []
@@ -717,14 +717,6 @@ def resultados(question_id: int):
         # Ordenar de mayor a menor por porcentaje (coeficiente)
         results_list.sort(key=lambda x: x["percentage"], reverse=True)
 
-        # Obtener total de participantes registrados en la base
-        total_registered_result = execute_query(
-            conn,
-            "SELECT COUNT(*) as total_registered FROM participants",
-            fetchone=True
-        )
-        total_registered = total_registered_result["total_registered"] if total_registered_result else 0
-
         return {
             "question_id": question_id,
             "question_text": q["text"],
@@ -744,93 +736,60 @@ def resultados(question_id: int):
 # --- Endpoint para calcular aforo/quorum ---
 @router.get("/aforo")
 def get_aforo(user=Depends(admin_required)):
-    conn = get_db()
-    try:
-        # Totales generales
-        totals = execute_query(
-            conn,
-            "SELECT COUNT(*) as total_participants, SUM(coefficient) as total_coefficient FROM participants",
-            fetchone=True
-        )
-        total_participants = totals["total_participants"] or 0
-        total_coefficient = totals["total_coefficient"] or 0.0
-
-        # Presentes (AGREGAR coeficiente presente) - FIX: usar TRUE/FALSE
-        present_data = execute_query(
-            conn,
-            "SELECT COUNT(*) as present_count, SUM(coefficient) as present_coefficient FROM participants WHERE present = 1",
-            fetchone=True
-        )
-        present_count = present_data["present_count"] or 0
-        present_coefficient = present_data["present_coefficient"] or 0.0
-
-        # FIX: Cambiar 1 y 0 por TRUE y FALSE
-        own_votes_result = execute_query(
-            conn,
-            "SELECT COUNT(*) as own_count FROM participants WHERE present = 1 AND is_power = FALSE",
-            fetchone=True
-        )
-        own_votes = own_votes_result["own_count"] or 0
-
-        power_votes_result = execute_query(
-            conn,
-            "SELECT COUNT(*) as power_count FROM participants WHERE present = 1 AND is_power = TRUE",
-            fetchone=True
-        )
-
-        power_votes = power_votes_result["power_count"] or 0
-
-        # Usar booleanos PostgreSQL
-        voted_data = execute_query(
-            conn,
-            "SELECT COUNT(*) as voted_count FROM participants WHERE present = 1 AND has_voted = 1",
-            fetchone=True
-        )
-        voted_count = voted_data["voted_count"] or 0
-
-        # Cálculos de porcentajes
-        participation_rate = (present_count / total_participants * 100) if total_participants > 0 else 0
-        coefficient_rate = present_coefficient if total_coefficient > 0 else 0
-
-        return {
-            "total_participants": total_participants,
-            "total_coefficient": total_coefficient,
-            "present_count": present_count,
-            "present_coefficient": present_coefficient,
-            "own_votes": own_votes,
-            "power_votes": power_votes,
-            "voted_count": voted_count,
-            "participation_rate_percent": round(participation_rate, 2),
-            "coefficient_rate_percent": round(coefficient_rate, 2),
-        }
-    finally:
-        close_db(conn)
-
-# --- Reset DB (solo admin): borra preguntas, opciones, votos y resetea participantes ---
-@router.delete("/admin/reset", dependencies=[Depends(admin_required)])
-async def reset_db():
-    conn = get_db()
-    try:
+    # Aforo completo en una sola consulta, cacheada hasta la próxima escritura
+    stats = get_cached_aforo_stats()
+    total_participants = stats["total_participants"] or 0
+    total_coefficient = stats["total_coefficient"] or 0.0
+    present_count = stats["present_count"] or 0
+    present_coefficient = stats["present_coefficient"] or 0.0
+    own_votes = stats["own_votes"] or 0
+    power_votes = stats["power_votes"] or 0
+    voted_count = stats["voted_count"] or 0
+
+    # Cálculos de porcentajes
+    participation_rate = (present_count / total_participants * 100) if total_participants > 0 else 0
+    coefficient_rate = present_coefficient if total_coefficient > 0 else 0
+
+    return {
+        "total_participants": total_participants,
+        "total_coefficient": total_coefficient,
+        "present_count": present_count,
+        "present_coefficient": present_coefficient,
+        "own_votes": own_votes,
+        "power_votes": power_votes,
+        "voted_count": voted_count,
+        "participation_rate_percent": round(participation_rate, 2),
+        "coefficient_rate_percent": round(coefficient_rate, 2),
+        "server_time": stats["server_time"],
+    }
+
+def _resetear_asamblea():
+    """Borrar votaciones y asistencia (bloqueante: se ejecuta en el threadpool)"""
+    with get_conn() as conn:
         # Solo resetear votos y preguntas, NO config
         execute_query(conn, "DELETE FROM votes", commit=True)
         execute_query(conn, "DELETE FROM options", commit=True) 
         execute_query(conn, "DELETE FROM questions", commit=True)
         execute_query(conn, "DELETE FROM participants", commit=True)
-        execute_query(conn, "DELETE FROM config", commit=True)
+        execute_query(conn, "DELETE FROM config WHERE key <> 'schema_version'", commit=True)
         execute_query(conn, "ALTER SEQUENCE questions_id_seq RESTART WITH 1", commit=True)
         execute_query(conn, "ALTER SEQUENCE options_id_seq RESTART WITH 1", commit=True)
+        # Aforo, preguntas activas y datos por votante quedan obsoletos
+        query_cache.clear()
 
-        # WEBSOCKET: Notificar reset completo
-        from ..main import manager
-        await manager.broadcast_to_voters({
-            "type": "system_reset",
-            "data": {"message": "La asamblea ha sido reiniciada por el administrador"}
-        })
-        await manager.broadcast_to_admins({
-            "type": "system_reset",
-            "data": {"message": "Base de datos reiniciada exitosamente"}
-        })
-        
-        return {"status": "votaciones y asistencias reseteadas"}
-    finally:
-        close_db(conn)
\ No newline at end of file
+# --- Reset DB (solo admin): borra preguntas, opciones, votos y resetea participantes ---
+@router.delete("/admin/reset", dependencies=[Depends(admin_required)])
+async def reset_db():
+    await run_in_threadpool(_resetear_asamblea)
+
+    # WEBSOCKET: Notificar reset completo
+    await manager.broadcast_to_voters({
+        "type": "system_reset",
+        "data": {"message": "La asamblea ha sido reiniciada por el administrador"}
+    })
+    await manager.broadcast_to_admins({
+        "type": "system_reset",
+        "data": {"message": "Base de datos reiniciada exitosamente"}
+    })
+    
+    return {"status": "votaciones y asistencias reseteadas"}
\ No newline at end of file